@@ -0,0 +1,103 @@
+"""
+Compare the day-by-day walk with delimiter discovery in available_dates.
+
+Runs both discovery modes against a stubbed S3 client that sleeps for a fixed
+round trip per call, and checks that they return the same top-10 dates.
+
+    python benchmarks/bench_available_dates.py --latency-ms 20
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import available_dates  # noqa: E402
+
+
+class StubS3:
+    """Serves a fixed set of date folders with a simulated round-trip delay."""
+
+    def __init__(self, device_name, folder_sizes, latency):
+        self.client_name = device_name.split("_")[0]
+        self.root = f"{self.client_name}-raw-data/{device_name}/"
+        self.folder_sizes = folder_sizes
+        self.latency = latency
+        self.calls = 0
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if Delimiter:
+            return {
+                "CommonPrefixes": [
+                    {"Prefix": f"{self.root}{date}/"} for date in self.folder_sizes
+                ]
+            }
+        date = Prefix[len(self.root) :].split("/")[0]
+        if date not in self.folder_sizes:
+            return {}
+        return {"Contents": [{"Size": self.folder_sizes[date]}]}
+
+    def get_paginator(self, operation_name):
+        stub = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield stub.list_objects_v2(**kwargs)
+
+        return Paginator()
+
+
+def make_folders(days, every):
+    today = datetime.now()
+    start = datetime(today.year, 1, 1)
+    folders = {}
+    for i in range(days):
+        day = today - timedelta(days=i)
+        if day < start:
+            break
+        if i % every == 0:
+            size = 30 * 1024 * 1024 if i % (every * 2) == 0 else 1024
+            folders[day.strftime("%Y-%m-%d")] = size
+    return folders
+
+
+def run(mode, stub, device_name):
+    available_dates.s3 = stub
+    available_dates.clear_caches()
+    stub.calls = 0
+    started = time.perf_counter()
+    if mode == "walk":
+        result = available_dates.walk_dates(device_name)
+    else:
+        result = available_dates.discover_dates(device_name)
+    elapsed = time.perf_counter() - started
+    return sorted(result, reverse=True)[:10], elapsed, stub.calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--every", type=int, default=3)
+    args = parser.parse_args()
+
+    device_name = "client1_device_01"
+    stub = StubS3(device_name, make_folders(args.days, args.every), args.latency_ms / 1000)
+
+    walk, walk_time, walk_calls = run("walk", stub, device_name)
+    found, found_time, found_calls = run("delimiter", stub, device_name)
+    assert walk == found, (walk, found)
+
+    print(f"walk:      {walk_time * 1000:8.1f} ms  {walk_calls:4d} calls")
+    print(f"delimiter: {found_time * 1000:8.1f} ms  {found_calls:4d} calls")
+    print(f"speedup:   {walk_time / found_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
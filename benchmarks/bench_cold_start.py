@@ -0,0 +1,430 @@
+"""
+Cold-start benchmark for every handler module in lambda/.
+
+Each run imports one handler in a fresh interpreter and invokes it twice.
+AWS is stubbed with a botocore before-call hook that answers every
+operation from memory after --latency-ms, and psycopg2.connect with an
+in-memory connection, so only the module's own start-up work is timed.
+boto3 and botocore are imported before the clock starts; their cost is the same
+for every function and is reported once as "botocore".
+
+Per handler it records:
+
+    import   wall time of importing the module (Lambda's INIT phase)
+    init     time spent building boto3 clients during the first invocation,
+             summed over threads
+    first    wall time of the first invocation, init included
+    warm     wall time of the second invocation
+    clients  boto3 clients/resources built at import and on first call
+    calls    AWS API calls made by the first invocation
+
+Results are compared with benchmarks/cold_start_baseline.json:
+
+    python benchmarks/bench_cold_start.py            # print and compare
+    python benchmarks/bench_cold_start.py --check    # exit 1 on a count regression
+    python benchmarks/bench_cold_start.py --update   # rewrite the baseline
+
+--lambda-dir times another copy of the package, e.g. an older revision:
+
+    git archive HEAD~1 lambda | tar -x -C /tmp/before
+    python benchmarks/bench_cold_start.py --lambda-dir /tmp/before/lambda
+
+A regression is more clients built at import or more AWS calls on the
+first invocation. These counts do not depend on the machine, so --check
+gives the same answer locally and on CI. The baseline's timings come from
+whichever host last ran --update. A median time above them by more than
+--tolerance (a fraction) plus --slack-ms is reported as "slower" but never
+fails the check.
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(HERE, "..", "lambda")
+BASELINE = os.path.join(HERE, "cold_start_baseline.json")
+TODAY = datetime.now().strftime("%Y-%m-%d")
+YESTERDAY = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+QUEUE_ENV = {
+    "QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/123456789012/jobs.fifo",
+    "QUEUE_URL_2": "https://sqs.us-east-1.amazonaws.com/123456789012/analysis",
+    "INSTANCE_ID": "i-0123456789abcdef0",
+}
+VIDEO_ENV = {"BUCKET_NAME": "videos-bucket", "CLOUDFRONT_DOMAIN": "cdn.example.com"}
+
+# module: (environment, event)
+HANDLERS = {
+    "available_dates": ({}, {"queryStringParameters": {"Device": "acme_cam_1"}}),
+    "check_models": (
+        {},
+        {
+            "queryStringParameters": {
+                "device_name": "acme_cam_1",
+                "ClientNumber": "3",
+                "Date": "2025-03-01",
+            }
+        },
+    ),
+    "check_queue": (
+        QUEUE_ENV,
+        {"queryStringParameters": {"Device": "acme_cam_1", "Date": "2025-03-01"}},
+    ),
+    "dynamodb_fn": ({}, {"queryStringParameters": {"device_name": "acme_cam_1"}}),
+    "inventory_volumes": ({}, {}),
+    "job_status": (
+        {"JOB_STATUS_TABLE": "JobStatus"},
+        {"queryStringParameters": {"job_id": "abc"}},
+    ),
+    "query_rds": ({}, {}),
+    "s3_full_test": (VIDEO_ENV, {"queryStringParameters": None}),
+    "s3_match": (VIDEO_ENV, {"queryStringParameters": None}),
+    "video_catalog": (
+        VIDEO_ENV,
+        {
+            "Records": [
+                {
+                    "eventName": "ObjectCreated:Put",
+                    "s3": {
+                        "bucket": {"name": "videos-bucket"},
+                        "object": {"key": "video/acme_site_cam_2025-03-01_1.mp4"},
+                    },
+                }
+            ]
+        },
+    ),
+    "worker_scaler": (
+        {"QUEUE_URL": QUEUE_ENV["QUEUE_URL"], "WORKER_INSTANCE_IDS": "i-0123456789abcdef0"},
+        {},
+    ),
+}
+
+
+class StubHttp:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+class StubConnection:
+    closed = 0
+    autocommit = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.sql = sql
+
+    def fetchall(self):
+        if "count(*)" in self.sql:
+            return [(1, None)]
+        return [("Client", "Cam", "client_dev_1", 1)]
+
+    def close(self):
+        self.closed = 1
+
+
+def video_catalog_body():
+    return json.dumps(
+        {
+            "built_at": time.time(),
+            "videos": {
+                "video/acme_site_cam_2025-03-01_0.mp4": [
+                    "acme",
+                    "site",
+                    "cam",
+                    "2025-03-01",
+                    "2025-03-01 12:00:00+00:00",
+                    1024,
+                ]
+            },
+            "pdfs": [],
+        }
+    ).encode()
+
+
+def s3_response(operation, request):
+    from botocore.response import StreamingBody
+
+    query = request.get("query_string") or {}
+    path = request.get("url_path", "")
+    if operation == "ListObjectsV2":
+        prefix = query.get("prefix", "")
+        if query.get("delimiter"):
+            prefixes = [{"Prefix": f"{prefix}{YESTERDAY}/"}, {"Prefix": f"{prefix}{TODAY}/"}]
+            return 200, {"CommonPrefixes": prefixes, "IsTruncated": False}
+        contents = [{"Key": f"{prefix}frame_{i}.jpg", "Size": 8 * 1024 * 1024} for i in range(4)]
+        contents.append({"Key": f"{prefix}model.pt", "Size": 1})
+        return 200, {"Contents": contents, "IsTruncated": False, "KeyCount": len(contents)}
+    if operation == "GetObject":
+        if "/catalog/" not in path:
+            return 404, {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}
+        body = video_catalog_body()
+        return 200, {"Body": StreamingBody(io.BytesIO(body), len(body)), "ETag": '"v1"'}
+    if operation == "HeadObject":
+        return 200, {
+            "ETag": '"v1"',
+            "LastModified": datetime(2025, 3, 1, tzinfo=timezone.utc),
+            "ContentLength": 1,
+        }
+    return 200, {"ETag": '"v1"'}
+
+
+def json_body(request):
+    body = request.get("body") or b"{}"
+    return json.loads(body.decode() if isinstance(body, bytes) else body)
+
+
+def respond(service, operation, request):
+    if service == "s3":
+        return s3_response(operation, request)
+    if service == "sqs":
+        if operation == "GetQueueAttributes":
+            return 200, {
+                "Attributes": {
+                    "ApproximateNumberOfMessages": "0",
+                    "ApproximateNumberOfMessagesNotVisible": "0",
+                }
+            }
+        return 200, {"MessageId": "m-1", "Successful": [], "Failed": []}
+    if service == "ec2":
+        instance = {"InstanceId": QUEUE_ENV["INSTANCE_ID"], "State": {"Name": "running"}}
+        return 200, {"Reservations": [{"Instances": [instance]}]}
+    if service == "ssm":
+        if operation == "GetParameter":
+            name = json_body(request).get("Name", "")
+            if "credentials" in name:
+                value = json.dumps({"host": "db", "user": "u", "password": "p"})
+            else:
+                value = "{}"
+            return 200, {"Parameter": {"Name": name, "Value": value}}
+        return 200, {"Version": 1}
+    if service == "dynamodb":
+        return 200, {
+            "Item": {
+                "DeviceName": {"S": "acme_cam_1"},
+                "JobId": {"S": "abc"},
+                "Status": {"S": "queued"},
+                "Python Map": {"M": {"graph_folder": {"S": "graphs/acme"}}},
+            }
+        }
+    return 200, {}
+
+
+def child(module_name, latency, lambda_dir):
+    import botocore.handlers
+
+    calls = []
+
+    def stub(model, params, **kwargs):
+        service = model.service_model.service_name
+        calls.append(f"{service}.{model.name}")
+        time.sleep(latency)
+        status, parsed = respond(service, model.name, params)
+        parsed.setdefault("ResponseMetadata", {"HTTPStatusCode": status, "HTTPHeaders": {}})
+        return StubHttp(status), parsed
+
+    botocore.handlers.BUILTIN_HANDLERS.append(("before-call", stub))
+    try:
+        import psycopg2
+
+        psycopg2.connect = lambda **kwargs: StubConnection()
+    except ImportError:
+        pass
+
+    import boto3
+
+    # Count and time every client or resource built, whether at import or
+    # on the first call, however the module creates them
+    building = {"seconds": 0.0, "built": 0}
+
+    def timed(factory):
+        def build(*args, **kwargs):
+            begun = time.perf_counter()
+            try:
+                return factory(*args, **kwargs)
+            finally:
+                building["seconds"] += time.perf_counter() - begun
+                building["built"] += 1
+
+        return build
+
+    boto3.client, boto3.resource = timed(boto3.client), timed(boto3.resource)
+
+    sys.path.insert(0, lambda_dir)
+    started = time.perf_counter()
+    module = __import__(module_name)
+    imported = time.perf_counter()
+    clients_at_import = building["built"]
+    building.update(seconds=0.0, built=0)
+    event = HANDLERS[module_name][1]
+
+    first_started = time.perf_counter()
+    module.handler(json.loads(json.dumps(event)), None)
+    first_done = time.perf_counter()
+    first_calls = len(calls)
+    module.handler(json.loads(json.dumps(event)), None)
+    warm_done = time.perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "import": imported - started,
+                "init": building["seconds"],
+                "first": first_done - first_started,
+                "warm": warm_done - first_done,
+                "clients_at_import": clients_at_import,
+                "clients_first": building["built"],
+                "calls": first_calls,
+            }
+        )
+    )
+
+
+def botocore_import_time():
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import time; t = time.perf_counter(); import boto3; "
+            "print(time.perf_counter() - t)",
+        ]
+    )
+    return float(output.decode().strip())
+
+
+def measure(module_name, runs, latency_ms, lambda_dir):
+    env = dict(os.environ, AWS_DEFAULT_REGION="us-east-1")
+    env.update(
+        AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing", **HANDLERS[module_name][0]
+    )
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                module_name,
+                "--latency-ms",
+                str(latency_ms),
+                "--lambda-dir",
+                lambda_dir,
+            ],
+            env=env,
+            cwd=HERE,
+        )
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    def median(name):
+        values = sorted(r[name] for r in results)
+        return values[len(values) // 2]
+
+    return {
+        "import_ms": round(median("import") * 1000, 1),
+        "init_ms": round(median("init") * 1000, 1),
+        "first_ms": round(median("first") * 1000, 1),
+        "warm_ms": round(median("warm") * 1000, 1),
+        "clients_at_import": max(r["clients_at_import"] for r in results),
+        "clients_first": max(r["clients_first"] for r in results),
+        "calls": max(r["calls"] for r in results),
+    }
+
+
+def regressions(name, result, baseline):
+    found = []
+    if baseline is None:
+        return found
+    for key in ("clients_at_import", "calls"):
+        if result[key] > baseline[key]:
+            found.append(f"{name}: {key} {baseline[key]} -> {result[key]}")
+    return found
+
+
+def slower(name, result, baseline, tolerance, slack_ms):
+    found = []
+    if baseline is None:
+        return found
+    for key in ("import_ms", "first_ms"):
+        limit = baseline[key] * (1 + tolerance) + slack_ms
+        if result[key] > limit:
+            found.append(f"{name}: {key} {baseline[key]} -> {result[key]} (limit {limit:.1f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--handlers", nargs="+", default=sorted(HANDLERS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--slack-ms", type=float, default=10.0)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update", action="store_true")
+    parser.add_argument("--lambda-dir", default=LAMBDA_DIR)
+    parser.add_argument("--child")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.latency_ms / 1000, args.lambda_dir)
+        return
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    print(f"botocore: {botocore_import_time() * 1000:.1f} ms to import boto3")
+    print(
+        f"{'handler':<18} {'import':>8} {'init':>7} {'first':>8} {'warm':>7} "
+        f"{'clients':>8} {'calls':>6}"
+    )
+    results, found, notes = {}, [], []
+    for name in args.handlers:
+        result = measure(name, args.runs, args.latency_ms, os.path.abspath(args.lambda_dir))
+        results[name] = result
+        print(
+            f"{name:<18} {result['import_ms']:>8.1f} {result['init_ms']:>7.1f} "
+            f"{result['first_ms']:>8.1f} {result['warm_ms']:>7.1f} "
+            f"{result['clients_at_import']:>3}+{result['clients_first']:<4} {result['calls']:>6}"
+        )
+        previous = baseline.get("handlers", {}).get(name)
+        found += regressions(name, result, previous)
+        notes += slower(name, result, previous, args.tolerance, args.slack_ms)
+
+    if args.update:
+        baseline = {
+            "latency_ms": args.latency_ms,
+            "runs": args.runs,
+            "python": sys.version.split()[0],
+            "handlers": {**baseline.get("handlers", {}), **results},
+        }
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote {os.path.relpath(BASELINE)}")
+        return
+
+    for line in notes:
+        print(f"slower {line}")
+    for line in found:
+        print(f"REGRESSION {line}")
+    if args.check and found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measure import and import-to-first-response time for query_rds.
+
+Each run happens in a fresh interpreter. SSM answers after a simulated
+round trip and psycopg2.connect is replaced by an in-memory stand-in, so
+only the module's own start-up work is timed. Pass --module to time another
+copy of the file, e.g. the previous revision:
+
+    git show HEAD~1:lambda/query_rds.py > /tmp/query_rds_before.py
+    python benchmarks/bench_query_rds_cold_start.py --module /tmp/query_rds_before.py
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+
+from botocore.hooks import HierarchicalEmitter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(HERE, "..", "lambda")
+DEFAULT_MODULE = os.path.join(LAMBDA_DIR, "query_rds.py")
+
+
+class StubSSM:
+    def __init__(self, latency):
+        self.latency = latency
+        # instrumentation registers its call hooks here; they never fire
+        self.meta = types.SimpleNamespace(events=HierarchicalEmitter())
+
+    def get_parameter(self, Name, WithDecryption=True):
+        time.sleep(self.latency)
+        value = json.dumps({"host": "db", "user": "u", "password": "p"})
+        return {"Parameter": {"Value": value}}
+
+
+class StubConnection:
+    closed = 0
+    autocommit = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.sql = sql
+
+    def fetchall(self):
+        if "count(*)" in self.sql:
+            return [(1, None)]
+        return [("Client", "Cam", "client_dev_1", 1)]
+
+    def close(self):
+        self.closed = 1
+
+
+def child(path, latency):
+    import boto3
+    import psycopg2
+
+    real_client = boto3.client
+
+    def client(service, *args, **kwargs):
+        if service == "ssm":
+            return StubSSM(latency)
+        return real_client(service, *args, **kwargs)
+
+    boto3.client = client
+    psycopg2.connect = lambda **kwargs: StubConnection()
+
+    # query_rds imports its sibling modules (aws_clients, warm_cache, ...);
+    # a copy saved elsewhere picks them up from lambda/
+    sys.path.insert(0, LAMBDA_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("query_rds", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+    module.handler({}, None)
+    responded = time.perf_counter()
+    print(json.dumps({"import": imported - started, "first": responded - started}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.module, args.latency_ms / 1000)
+        return
+
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.check_output(
+            [sys.executable, __file__, "--child", "--module", args.module,
+             "--latency-ms", str(args.latency_ms)],
+            env=env,
+        )
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    for name in ("import", "first"):
+        values = sorted(run[name] * 1000 for run in runs)
+        print(f"{name:>6}: median {values[len(values) // 2]:7.1f} ms  min {values[0]:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
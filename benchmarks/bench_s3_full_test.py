@@ -0,0 +1,99 @@
+"""
+Time the vis_test/ to pdf_evidance/ join in s3_full_test on a large listing.
+
+The stub S3 serves every object in a single response to a plain
+list_objects_v2 call, the way the previous one-page handler saw them, and
+in 1000-key pages through the paginator. Pass --module to time another
+copy of the handler, e.g. the previous revision:
+
+    git show HEAD~1:lambda/s3_full_test.py > /tmp/s3_full_test_before.py
+    python benchmarks/bench_s3_full_test.py --module /tmp/s3_full_test_before.py
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("BUCKET_NAME", "bench-bucket")
+os.environ.setdefault("CLOUDFRONT_DOMAIN", "cdn.example.com")
+
+
+class StubS3:
+    def __init__(self, objects, page_size=1000):
+        self.objects = objects
+        self.page_size = page_size
+
+    def matching(self, Prefix):
+        return [obj for obj in self.objects if obj["Key"].startswith(Prefix)]
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        return {"Contents": self.matching(Prefix)}
+
+    def get_paginator(self, operation_name):
+        stub = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, **kwargs):
+                objects = stub.matching(Prefix)
+                for i in range(0, len(objects), stub.page_size):
+                    yield {"Contents": objects[i : i + stub.page_size]}
+
+        return Paginator()
+
+
+def make_objects(count):
+    modified = datetime(2025, 3, 1, 12, 0, 0)
+    objects = []
+    for i in range(count):
+        stem = f"client{i % 7}_site_device{i}_2025-03-{i % 28 + 1:02d}_{i}"
+        objects.append({"Key": f"vis_test/{stem}.mp4", "LastModified": modified, "Size": i})
+        if i % 2 == 0:
+            objects.append({"Key": f"pdf_evidance/{stem}.pdf", "LastModified": modified, "Size": i})
+    # S3 lists keys in lexicographic order
+    return sorted(objects, key=lambda obj: obj["Key"])
+
+
+def load(path):
+    spec = importlib.util.spec_from_file_location(f"bench_{abs(hash(path))}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default=os.path.join(HERE, "..", "lambda", "s3_full_test.py"))
+    parser.add_argument("--videos", type=int, default=50000)
+    args = parser.parse_args()
+
+    stub = StubS3(make_objects(args.videos))
+    module = load(args.module)
+    module.s3 = stub
+    if hasattr(module, "VIDEO_CATALOG"):
+        # Time the listing path, not a read of a prebuilt catalog
+        import video_catalog
+
+        video_catalog.s3 = stub
+        module.VIDEO_CATALOG = "off"
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = module.handler({}, None)
+    elapsed = time.perf_counter() - started
+
+    videos = json.loads(response["body"])
+    matched = sum(1 for video in videos if video["pdf_url"])
+    print(f"{args.module}: {elapsed * 1000:.1f} ms, {len(videos)} videos, {matched} with pdf")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Peak memory of encoding a video listing, list-then-dump vs incremental.
+
+Both start from the same catalog; the "list" column builds every entry dict
+and calls json.dumps on the list, as the handlers used to, the "stream"
+column writes the body one entry at a time.
+
+    python benchmarks/bench_video_encoding.py --videos 10000 50000 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import video_catalog  # noqa: E402
+
+
+def make_catalog(count):
+    videos = {}
+    for i in range(count):
+        key = f"vis_test/client{i % 7}_site_device{i}_2025-03-{i % 28 + 1:02d}_{i}.mp4"
+        videos[key] = video_catalog.make_record(
+            "vis_test/", key, "2025-03-01 12:00:00+00:00", i
+        )
+    pdfs = [k[len("vis_test/") : -len(".mp4")] for k in list(videos)[::2]]
+    return {"built_at": 0, "videos": videos, "pdfs": pdfs}
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    body = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return body, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, nargs="+", default=[10000, 50000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'videos':>8} {'body MB':>8} {'list MB':>8} {'stream MB':>10} {'list s':>7} {'stream s':>9}")
+    for count in args.videos:
+        catalog = make_catalog(count)
+
+        def as_list():
+            entries = list(video_catalog.iter_videos(catalog, "vis_test/", "cdn.example.com"))
+            return json.dumps(entries)
+
+        def as_stream():
+            entries = video_catalog.iter_videos(catalog, "vis_test/", "cdn.example.com")
+            return video_catalog.encode(video_catalog.iter_json(entries))
+
+        listed, list_peak, list_time = measure(as_list)
+        streamed, stream_peak, stream_time = measure(as_stream)
+        assert listed == streamed
+        mb = 1024 * 1024
+        print(
+            f"{count:>8} {len(streamed) / mb:>8.1f} {list_peak / mb:>8.1f} "
+            f"{stream_peak / mb:>10.1f} {list_time:>7.2f} {stream_time:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
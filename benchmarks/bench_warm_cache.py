@@ -0,0 +1,74 @@
+"""
+Long-running load test of the shared warm-container cache.
+
+Drives dynamodb_fn.get_graph_folders, which sits behind a WarmCache, with
+a skewed stream of device lookups against a stub table, the way one warm
+container sees traffic over its lifetime. Every --report requests it
+prints the hit rate so far, the cache's size and evictions, and the traced
+memory; memory should level off once the cache is full.
+
+    python benchmarks/bench_warm_cache.py --requests 200000 --devices 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("DEVICE_CACHE_SIZE", "1024")
+os.environ.setdefault("DEVICE_CACHE_TTL", "3600")
+
+import dynamodb_fn  # noqa: E402
+
+
+class StubTable:
+    """Answers GetItem from memory and counts the reads."""
+
+    def __init__(self):
+        self.reads = 0
+
+    def get_item(self, Key, **kwargs):
+        self.reads += 1
+        name = Key["DeviceName"]
+        return {"Item": {"Python Map": {"graph_folder": f"graphs/{name}"}}}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=20000)
+    parser.add_argument("--report", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.2)
+    args = parser.parse_args()
+
+    table = StubTable()
+    dynamodb_fn.table = table
+    cache = dynamodb_fn.device_cache
+    rng = random.Random(7)
+    # Zipf-like popularity: a few devices take most of the lookups
+    weights = [1 / (rank + 1) ** args.skew for rank in range(args.devices)]
+    names = [f"acme_cam_{i}" for i in range(args.devices)]
+
+    tracemalloc.start()
+    print(f"{'requests':>9} {'hit rate':>9} {'entries':>8} {'evictions':>10} {'traced KB':>10}")
+    done = 0
+    while done < args.requests:
+        batch = rng.choices(names, weights, k=args.report)
+        for name in batch:
+            dynamodb_fn.get_graph_folders([name])
+        done += len(batch)
+        current, _ = tracemalloc.get_traced_memory()
+        lookups = cache.stats["hits"] + cache.stats["misses"]
+        print(
+            f"{done:>9} {cache.stats['hits'] / lookups:>9.1%} {len(cache):>8} "
+            f"{cache.stats['evictions']:>10} {current / 1024:>10.0f}"
+        )
+    tracemalloc.stop()
+    print(f"table reads: {table.reads} for {done} lookups")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ from aws_cdk import (
     aws_apigateway as apigw,
     aws_iam as iam,
     aws_sqs as sqs,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_s3 as s3,
+    aws_s3_notifications as s3n,
+    Duration,
 )
 import os
 import dotenv
@@ -32,6 +38,20 @@ class CdkAppStack(Stack):
             fifo=False,
         )
 
+        # Job id -> queued/running/done/failed; the workers update it as they
+        # pick jobs up and finish them. Off unless JOB_TRACKING=true, since
+        # until the workers report status every job would stay "queued".
+        job_tracking = os.environ.get("JOB_TRACKING", "false").lower() == "true"
+        job_status_table = dynamodb.Table(
+            self,
+            "JobStatusTable",
+            partition_key=dynamodb.Attribute(
+                name="JobId", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="ExpiresAt",
+        )
+
         check_queue_fn = _lambda.Function(
             self,
             "CheckQueueLambda",
@@ -40,9 +60,75 @@ class CdkAppStack(Stack):
             code=_lambda.Code.from_asset("lambda"),
             environment={
                 "QUEUE_URL": queue.queue_url,
+                "QUEUE_URL_2": queue2.queue_url,
                 "INSTANCE_ID": os.environ.get("EC2_INSTANCE_ID", ""),
+                # worker_scaler starts and stops the pool from queue depth
+                "EC2_START_ON_SUBMIT": "false",
+                # Submissions past these depths get 429 with a Retry-After
+                "MAX_QUEUE_DEPTH": os.environ.get("MAX_QUEUE_DEPTH", "0"),
+                "MAX_QUEUE_DEPTH_2": os.environ.get("MAX_QUEUE_DEPTH_2", "0"),
+                "JOB_STATUS_TABLE": job_status_table.table_name if job_tracking else "",
+                "JOB_RESUBMIT_AFTER": os.environ.get("JOB_RESUBMIT_AFTER", "300"),
+            },
+        )
+        if job_tracking:
+            job_status_table.grant_read_write_data(check_queue_fn)
+
+        job_status_fn = _lambda.Function(
+            self,
+            "JobStatusLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="job_status.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            environment={
+                "JOB_STATUS_TABLE": job_status_table.table_name,
+            },
+        )
+        job_status_table.grant_read_data(job_status_fn)
+
+        worker_scaler_fn = _lambda.Function(
+            self,
+            "WorkerScalerLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="worker_scaler.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            environment={
+                # Only the FIFO queue; the EC2 workers do not consume queue2
+                "SCALER_QUEUE_URLS": queue.queue_url,
+                "WORKER_INSTANCE_IDS": os.environ.get(
+                    "EC2_WORKER_INSTANCE_IDS", os.environ.get("EC2_INSTANCE_ID", "")
+                ),
+                "SCALER_MAX_WORKERS": os.environ.get("SCALER_MAX_WORKERS", "1"),
+                "SCALER_BACKLOG_PER_WORKER": os.environ.get(
+                    "SCALER_BACKLOG_PER_WORKER", "5"
+                ),
             },
         )
+        worker_scaler_fn.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "sqs:GetQueueAttributes",
+                    "ec2:StartInstances",
+                    "ec2:StopInstances",
+                    "ec2:DescribeInstances",
+                ],
+                resources=["*"],
+            )
+        )
+        worker_scaler_fn.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["ssm:GetParameter", "ssm:PutParameter"],
+                resources=[
+                    f"arn:aws:ssm:{self.region}:{self.account}:parameter/worker-scaler/*"
+                ],
+            )
+        )
+        events.Rule(
+            self,
+            "WorkerScalerSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(1)),
+            targets=[targets.LambdaFunction(worker_scaler_fn)],
+        )
         dynamodb_fn = _lambda.Function(
             self,
             "DynamoDbLambda",
@@ -59,6 +145,7 @@ class CdkAppStack(Stack):
                 actions=[
                     "dynamodb:PutItem",
                     "dynamodb:GetItem",
+                    "dynamodb:BatchGetItem",
                     "dynamodb:UpdateItem",
                     "dynamodb:DeleteItem",
                     "dynamodb:Scan",
@@ -76,12 +163,28 @@ class CdkAppStack(Stack):
             handler="available_dates.handler",
             code=_lambda.Code.from_asset("lambda"),
         )
+        inventory_volumes = _lambda.Function(
+            self,
+            "InventoryVolumes",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="inventory_volumes.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                "INVENTORY_BUCKET": os.environ.get("INVENTORY_BUCKET", ""),
+                "INVENTORY_PREFIXES": os.environ.get("INVENTORY_PREFIXES", ""),
+            },
+        )
         check_models = _lambda.Function(
             self,
             "CheckModelLog",
             runtime=_lambda.Runtime.PYTHON_3_9,
             handler="check_models.handler",
             code=_lambda.Code.from_asset("lambda"),
+            environment={
+                "MODELS_MARKER_KEY": os.environ.get("MODELS_MARKER_KEY", ""),
+            },
         )
 
         queue.grant_consume_messages(check_queue_fn)
@@ -103,6 +206,9 @@ class CdkAppStack(Stack):
                 "DB_SECRET": os.environ.get("RDS_SECRET_ARN", ""),
                 "DB_RESOURCE_ARN": os.environ.get("RDS_RESOURCE_ARN", ""),
                 "DB_NAME": os.environ.get("DATABASE_NAME", ""),
+                "DB_PROXY_HOST": os.environ.get("DB_PROXY_HOST", ""),
+                "DIRECTORY_ENGINE": os.environ.get("DIRECTORY_ENGINE", "python"),
+                "DIRECTORY_CACHE_TTL": os.environ.get("DIRECTORY_CACHE_TTL", "60"),
             },
         )
 
@@ -152,6 +258,41 @@ class CdkAppStack(Stack):
         )
 
         available_dates.add_to_role_policy(s3_policy)
+        available_dates.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:PutObject"],
+                resources=["arn:aws:s3:::*-pilot/date-index/*"],
+            )
+        )
+
+        inventory_volumes.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket", "s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::{os.environ.get('INVENTORY_BUCKET', '*')}",
+                    f"arn:aws:s3:::{os.environ.get('INVENTORY_BUCKET', '*')}/*",
+                ],
+            )
+        )
+        inventory_volumes.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject"],
+                resources=["arn:aws:s3:::*-pilot/date-index/*"],
+            )
+        )
+        # Without ListBucket a missing index is a 403 instead of NoSuchKey
+        inventory_volumes.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=["arn:aws:s3:::*-pilot"],
+            )
+        )
+        events.Rule(
+            self,
+            "InventoryVolumesSchedule",
+            schedule=events.Schedule.cron(minute="0", hour="6"),
+            targets=[targets.LambdaFunction(inventory_volumes)],
+        )
 
         query_rds_fn.add_to_role_policy(
             iam.PolicyStatement(actions=["rds-data:ExecuteStatement"], resources=["*"])
@@ -171,6 +312,50 @@ class CdkAppStack(Stack):
             )
         )
 
+        video_bucket_name = os.environ.get("S3_BUCKET_NAME", "")
+        video_catalog_fn = _lambda.Function(
+            self,
+            "VideoCatalogLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="video_catalog.handler",
+            code=_lambda.Code.from_asset("lambda"),
+            timeout=Duration.minutes(1),
+            # One writer at a time, so concurrent notifications cannot
+            # overwrite each other's catalog updates
+            reserved_concurrent_executions=1,
+        )
+        catalog_policy = iam.PolicyStatement(
+            actions=["s3:ListBucket", "s3:GetObject"],
+            resources=[
+                f"arn:aws:s3:::{video_bucket_name}",
+                f"arn:aws:s3:::{video_bucket_name}/*",
+            ],
+        )
+        for fn in (video_catalog_fn, s3_match_fn, s3_full_test):
+            fn.add_to_role_policy(catalog_policy)
+        # The GET functions only read the catalogs
+        video_catalog_fn.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:PutObject"],
+                resources=[f"arn:aws:s3:::{video_bucket_name}/catalog/*"],
+            )
+        )
+
+        if video_bucket_name:
+            video_bucket = s3.Bucket.from_bucket_name(
+                self, "VideoBucket", video_bucket_name
+            )
+            for prefix in ("video/", "vis_test/", "pdf_evidance/"):
+                for event_type in (
+                    s3.EventType.OBJECT_CREATED,
+                    s3.EventType.OBJECT_REMOVED,
+                ):
+                    video_bucket.add_event_notification(
+                        event_type,
+                        s3n.LambdaDestination(video_catalog_fn),
+                        s3.NotificationKeyFilter(prefix=prefix),
+                    )
+
         api = apigw.RestApi(
             self,
             "AppApi",
@@ -181,9 +366,9 @@ class CdkAppStack(Stack):
             ),
         )
 
-        api.root.add_resource("checkqueue").add_method(
-            "GET", apigw.LambdaIntegration(check_queue_fn)
-        )
+        checkqueue = api.root.add_resource("checkqueue")
+        checkqueue.add_method("GET", apigw.LambdaIntegration(check_queue_fn))
+        checkqueue.add_method("POST", apigw.LambdaIntegration(check_queue_fn))
         api.root.add_resource("queryrds").add_method(
             "GET", apigw.LambdaIntegration(query_rds_fn)
         )
@@ -196,12 +381,15 @@ class CdkAppStack(Stack):
         api.root.add_resource("s3testreport").add_method(
             "GET", apigw.LambdaIntegration(s3_full_test)
         )
-        api.root.add_resource("checkmodel").add_method(
-            "GET", apigw.LambdaIntegration(check_models)
-        )
+        checkmodel = api.root.add_resource("checkmodel")
+        checkmodel.add_method("GET", apigw.LambdaIntegration(check_models))
+        checkmodel.add_method("POST", apigw.LambdaIntegration(check_models))
 
         api.root.add_resource("dynamodbfn").add_method(
             "GET", apigw.LambdaIntegration(dynamodb_fn)
         )
+        jobstatus = api.root.add_resource("jobstatus")
+        jobstatus.add_method("GET", apigw.LambdaIntegration(job_status_fn))
+        jobstatus.add_method("POST", apigw.LambdaIntegration(job_status_fn))
 
         self.api_url_output = api.url
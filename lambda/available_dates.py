@@ -1,20 +1,72 @@
-import boto3
+import aws_clients
+import instrumentation
 import os
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import json
 from datetime import datetime, timedelta
+from folder_sizer import folder_size
+from warm_cache import WarmCache
 
-s3 = boto3.client("s3")
-global dates
-dates = defaultdict(list)
+s3 = aws_clients.client("s3")
 
+# "delimiter" lists the existing date folders once and sizes them in parallel,
+# "walk" probes every day from today back to Jan 1 one request at a time.
+DATE_DISCOVERY = os.environ.get("DATE_DISCOVERY", "delimiter")
+MAX_WORKERS = int(os.environ.get("DATE_DISCOVERY_WORKERS", "8"))
+# "s3" keeps a per-device JSON manifest of day -> bytes so each request only
+# sizes the days after the last indexed one, "off" recomputes from listings.
+DATE_INDEX = os.environ.get("DATE_INDEX", "s3")
+DATE_INDEX_PREFIX = os.environ.get("DATE_INDEX_PREFIX", "date-index/")
+SIZE_THRESHOLD = int(float(os.environ.get("SIZE_THRESHOLD_MB", "20")) * 1024 * 1024)
+MAX_DATES = 10
 
-def get_dates(device_name):
 
-    global dates
-    end_date = datetime(datetime.now().year, 1, 1)
-    start_date = datetime.now()
+def new_stats():
+    return {"folders": 0, "pages": 0, "bytes": 0}
+
+
+def record(stats, size):
+    if stats is not None:
+        stats["folders"] += 1
+        stats["pages"] += size.pages
+        stats["bytes"] += size.bytes
+
+
+def list_date_folders(client_name, device_name, start_date, end_date):
+    """
+    List the date folders that exist for a device using a delimiter listing.
+
+    Args:
+        client_name (str): The client prefix of the device.
+        device_name (str): The device name.
+        start_date (datetime): The newest date to include.
+        end_date (datetime): The oldest date to include.
+
+    Returns:
+        list: Dates in the format 'YYYY-MM-DD', newest first.
+    """
+    prefix = f"{client_name}-raw-data/{device_name}/"
+    paginator = s3.get_paginator("list_objects_v2")
+    folders = []
+    for page in paginator.paginate(
+        Bucket=f"{client_name}-pilot", Prefix=prefix, Delimiter="/"
+    ):
+        for common_prefix in page.get("CommonPrefixes", []):
+            name = common_prefix["Prefix"][len(prefix) :].rstrip("/")
+            try:
+                folder_date = datetime.strptime(name, "%Y-%m-%d")
+            except ValueError:
+                continue
+            if end_date.date() <= folder_date.date() <= start_date.date():
+                folders.append(name)
+    return sorted(set(folders), reverse=True)
+
+
+def walk_dates(device_name, start_date=None, end_date=None, stats=None):
+    end_date = end_date or datetime(datetime.now().year, 1, 1)
+    start_date = start_date or datetime.now()
     delta = timedelta(days=1)
+    found = []
 
     current_date = start_date
     while current_date >= end_date:
@@ -24,30 +76,240 @@ def get_dates(device_name):
         client_name = device_name.split("_")[0]
         prefix = f"{client_name}-raw-data/{device_name}/{date}/all_frames/all_frames/"
         # print(prefix)
-        response = s3.list_objects_v2(Bucket=f"{client_name}-pilot", Prefix=prefix)
-        # print(response)
-        if "Contents" in response:
-            total_size = sum(obj["Size"] for obj in response["Contents"])
-            # print(total_size)
-            if total_size > 20 * 1024 * 1024:  # 20MB in bytes
-                # print(f"Folder size for date {date} ,{client_alias} exceeds 20MB: {total_size / (1024 * 1024):.2f} MB")
-                dates[device_name].append(date_ad)
-
-                if len(dates[device_name]) > 10:
-                    return dates[device_name]
-        # print(f"Folder size for date {date} ,{client_alias} exceeds 20MB: {total_size / (1024 * 1024):.2f} MB")
+        size = folder_size(s3, f"{client_name}-pilot", prefix, SIZE_THRESHOLD)
+        record(stats, size)
+        if size.exceeded:
+            # print(f"Folder size for date {date} exceeds 20MB: {size.bytes / (1024 * 1024):.2f} MB")
+            found.append(date_ad)
+
+            if len(found) >= MAX_DATES:
+                return found
         current_date -= delta
-    return dates[device_name]
+    return found
+
+
+def discover_dates(
+    device_name, start_date=None, end_date=None, max_workers=None, stats=None
+):
+    end_date = end_date or datetime(datetime.now().year, 1, 1)
+    start_date = start_date or datetime.now()
+    client_name = device_name.split("_")[0]
+    bucket = f"{client_name}-pilot"
+    max_workers = max_workers or MAX_WORKERS
+    found = []
+
+    candidates = list_date_folders(client_name, device_name, start_date, end_date)
+
+    def size_of(date):
+        prefix = f"{client_name}-raw-data/{device_name}/{date}/all_frames/all_frames/"
+        return folder_size(s3, bucket, prefix, SIZE_THRESHOLD)
+
+    # Size one window of folders at a time, newest first, so we can stop as
+    # soon as enough dates qualify without sizing the rest of the year.
+    sizer = instrumentation.bind(size_of)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in range(0, len(candidates), max_workers):
+            window = candidates[i : i + max_workers]
+            for date, size in zip(window, executor.map(sizer, window)):
+                record(stats, size)
+                if size.exceeded:
+                    date_ad = datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)
+                    found.append(date_ad.strftime("%Y-%m-%d"))
+
+                    if len(found) >= MAX_DATES:
+                        return found
+    return found
+
+
+def today_qualifies(device_name, now, stats=None):
+    client_name = device_name.split("_")[0]
+    date = now.strftime("%Y-%m-%d")
+    prefix = f"{client_name}-raw-data/{device_name}/{date}/all_frames/all_frames/"
+    size = folder_size(s3, f"{client_name}-pilot", prefix, SIZE_THRESHOLD)
+    record(stats, size)
+    return size.exceeded
+
+
+def find_dates(device_name, start_date, end_date, stats=None):
+    if DATE_DISCOVERY == "walk":
+        return walk_dates(device_name, start_date, end_date, stats=stats)
+    return discover_dates(device_name, start_date, end_date, stats=stats)
+
+
+def size_days(device_name, days, stats=None):
+    """
+    Size a set of date folders concurrently.
+
+    Args:
+        device_name (str): The device name.
+        days (list): Dates in the format 'YYYY-MM-DD'.
+        stats (dict): Optional counters updated with the listing cost.
+
+    Returns:
+        dict: Date to bytes seen. Sizing stops once a folder passes the
+        threshold, so qualifying days record a lower bound.
+    """
+    client_name = device_name.split("_")[0]
+    bucket = f"{client_name}-pilot"
+
+    def size_of(date):
+        prefix = f"{client_name}-raw-data/{device_name}/{date}/all_frames/all_frames/"
+        return folder_size(s3, bucket, prefix, SIZE_THRESHOLD)
+
+    sizes = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for date, size in zip(days, executor.map(instrumentation.bind(size_of), days)):
+            record(stats, size)
+            sizes[date] = size.bytes
+    return sizes
+
+
+def index_location(device_name):
+    client_name = device_name.split("_")[0]
+    return f"{client_name}-pilot", f"{DATE_INDEX_PREFIX}{device_name}.json"
+
+
+def load_index(device_name):
+    bucket, key = index_location(device_name)
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+
+def save_index(device_name, index):
+    bucket, key = index_location(device_name)
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(index, sort_keys=True),
+        ContentType="application/json",
+    )
+
+
+def update_index(device_name, now, stats=None):
+    """
+    Read the device's date index, size the days after the last indexed one
+    and write it back if anything changed.
+
+    Args:
+        device_name (str): The device name.
+        now (datetime): The current time; days before it are indexed.
+        stats (dict): Optional counters updated with the listing cost.
+
+    Returns:
+        dict: The index with 'threshold', 'last_indexed' and 'days' keys.
+    """
+    client_name = device_name.split("_")[0]
+    yesterday = now - timedelta(days=1)
+    start_of_year = datetime(now.year, 1, 1)
+    last_day = yesterday.strftime("%Y-%m-%d")
+
+    index = load_index(device_name)
+    if (
+        index is None
+        or index.get("threshold") != SIZE_THRESHOLD
+        or index.get("last_indexed", "") < start_of_year.strftime("%Y-%m-%d")
+    ):
+        index = {"threshold": SIZE_THRESHOLD, "last_indexed": None, "days": {}}
+        if DATE_DISCOVERY == "walk":
+            days = [
+                (start_of_year + timedelta(days=i)).strftime("%Y-%m-%d")
+                for i in range((yesterday - start_of_year).days + 1)
+            ]
+        else:
+            days = list_date_folders(client_name, device_name, yesterday, start_of_year)
+    elif index["last_indexed"] >= last_day:
+        return index
+    else:
+        first = datetime.strptime(index["last_indexed"], "%Y-%m-%d") + timedelta(days=1)
+        if DATE_DISCOVERY == "walk":
+            days = [
+                (first + timedelta(days=i)).strftime("%Y-%m-%d")
+                for i in range((yesterday.date() - first.date()).days + 1)
+            ]
+        else:
+            # Only the folders that exist, so a stale index costs no more
+            # than building one from scratch
+            days = list_date_folders(client_name, device_name, yesterday, first)
+
+    sizes = size_days(device_name, days, stats=stats)
+    index["days"].update({date: size for date, size in sizes.items() if size})
+    index["days"] = {
+        date: size
+        for date, size in index["days"].items()
+        if date >= start_of_year.strftime("%Y-%m-%d")
+    }
+    index["last_indexed"] = last_day
+    save_index(device_name, index)
+    return index
+
+
+def indexed_dates(index):
+    qualifying = sorted(
+        (date for date, size in index["days"].items() if size > SIZE_THRESHOLD),
+        reverse=True,
+    )[:MAX_DATES]
+    return [
+        (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        for date in qualifying
+    ]
+
+
+# Qualifying days before today never change, so they are kept per device
+# until the day rolls over (the day is part of the key) or the device is
+# evicted. Only today's folder is re-sized, at most every
+# DATE_CACHE_TODAY_TTL seconds.
+past_dates_cache = WarmCache(maxsize=int(os.environ.get("DATE_CACHE_SIZE", "256")))
+today_cache = WarmCache(
+    maxsize=int(os.environ.get("DATE_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("DATE_CACHE_TODAY_TTL", "300")),
+    stale_ttl=float(os.environ.get("DATE_CACHE_TODAY_STALE_TTL", "0")),
+)
+
+
+def clear_caches():
+    past_dates_cache.clear()
+    today_cache.clear()
+
+
+def get_dates(device_name, stats=None, now=None):
+    now = now or datetime.now()
+    day = now.strftime("%Y-%m-%d")
+    start_of_year = datetime(now.year, 1, 1)
+
+    def past_dates():
+        if DATE_INDEX == "s3":
+            return indexed_dates(update_index(device_name, now, stats=stats))
+        return find_dates(
+            device_name, now - timedelta(days=1), start_of_year, stats=stats
+        )
+
+    past = past_dates_cache.get_or_load((device_name, day), past_dates)
+    today = today_cache.get_or_load(
+        (device_name, day), lambda: today_qualifies(device_name, now, stats=stats)
+    )
+
+    date_list = list(past)
+    if today:
+        date_list.insert(0, (now + timedelta(days=1)).strftime("%Y-%m-%d"))
+    return date_list[:MAX_DATES]
 
 
+@instrumentation.instrumented
 def handler(event, context):
     # print(event,event.headers["device"])
 
     device = event["queryStringParameters"].get("Device")  # Parse the JSON string
     # device = body["device"]
     print(device)
-    date_list = get_dates(device)
-    date_list = json.dumps(sorted(date_list, reverse=True)[:10])
+    stats = new_stats()
+    date_list = get_dates(device, stats=stats)
+    print(
+        f"Sized {stats['folders']} folders: {stats['pages']} pages, {stats['bytes']} bytes"
+    )
+    date_list = json.dumps(sorted(date_list, reverse=True)[:MAX_DATES])
     return {
         "statusCode": 200,
         "headers": {"Access-Control-Allow-Origin": "*"},
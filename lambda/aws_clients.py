@@ -0,0 +1,83 @@
+import os
+import threading
+
+import boto3
+import instrumentation
+
+# "true" builds every declared client at import instead, for functions with
+# provisioned concurrency where INIT runs ahead of traffic
+EAGER = os.environ.get("AWS_CLIENTS_EAGER", "false").lower() == "true"
+
+# One client or resource per (kind, service, options) for the container
+_built = {}
+_lock = threading.Lock()
+
+
+def _build(kind, service, kwargs):
+    key = (kind, service, tuple(sorted(kwargs.items())))
+    built = _built.get(key)
+    if built is None:
+        with _lock:
+            built = _built.get(key)
+            if built is None:
+                if kind == "client":
+                    built = instrumentation.instrument_client(boto3.client(service, **kwargs))
+                else:
+                    built = boto3.resource(service, **kwargs)
+                    instrumentation.instrument_client(built.meta.client)
+                _built[key] = built
+    return built
+
+
+def get_client(service, **kwargs):
+    """
+    Return the container's boto3 client for a service, creating it once.
+    """
+    return _build("client", service, kwargs)
+
+
+def get_resource(service, **kwargs):
+    """
+    Return the container's boto3 resource for a service, creating it once.
+    """
+    return _build("resource", service, kwargs)
+
+
+class Lazy:
+    """
+    Stands in for an object that is only built on first attribute access.
+
+    Handlers keep module-level names like ``s3`` and ``sqs`` but a function
+    that never touches one does not pay for creating it, and importing a
+    module creates no clients at all.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = factory() if EAGER else None
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        return getattr(target, name)
+
+
+def client(service, **kwargs):
+    return Lazy(lambda: get_client(service, **kwargs))
+
+
+def resource(service, **kwargs):
+    return Lazy(lambda: get_resource(service, **kwargs))
+
+
+def lazy(factory):
+    return Lazy(factory)
+
+
+def reset():
+    """Forget the clients built so far, e.g. between tests."""
+    with _lock:
+        _built.clear()
@@ -1,7 +1,23 @@
 import json
-import boto3
+import aws_clients
+import instrumentation
 import os
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
+from warm_cache import WarmCache
+
+s3 = aws_clients.client("s3")
+
+MODEL_EXTENSIONS = (".pt", ".onnx", ".h5", ".engine")
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "16"))
+# Larger batches are rejected with a 400
+MAX_BATCH_PAIRS = int(os.environ.get("MAX_BATCH_PAIRS", "200"))
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,device",
+    "Access-Control-Allow-Methods": "OPTIONS,GET,POST",
+}
 
 
 def get_next_friday(date):
@@ -26,9 +42,155 @@ def get_next_friday(date):
     return formatted_date
 
 
-def handler(event, context):
-    s3 = boto3.client("s3")
+class ModelCatalog:
+    """
+    Warm-container cache of the model names under each bucket prefix.
+
+    Once ``ttl`` seconds pass an entry is revalidated with a single
+    ``head_object`` on ``marker_key`` (the object the model upload process
+    rewrites); the prefix is only listed again when its ETag or
+    LastModified changed, or when no marker is configured. Concurrent
+    callers share one refresh.
+    """
+
+    def __init__(self, ttl, marker_key=None, maxsize=16, stale_ttl=0):
+        self.marker_key = marker_key
+        self.cache = WarmCache(maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl)
+
+    def get(self, bucket, prefix):
+        def load():
+            return self.marker_version(bucket), list_models(bucket, prefix)
+
+        def revalidate(cached):
+            version = self.marker_version(bucket)
+            if version is not None and version == cached[0]:
+                return cached
+            return version, list_models(bucket, prefix)
+
+        return self.cache.get_or_load((bucket, prefix), load, revalidate)[1]
+
+    def marker_version(self, bucket):
+        if not self.marker_key:
+            return None
+        try:
+            response = s3.head_object(Bucket=bucket, Key=self.marker_key)
+        except s3.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "404":
+                return None
+            raise
+        return (response["ETag"], str(response["LastModified"]))
+
+    def invalidate(self):
+        self.cache.invalidate()
+
+
+def list_models(bucket, prefix):
+    """
+    List the model file names under a prefix.
+
+    Args:
+        bucket (str): The models bucket.
+        prefix (str): The models prefix.
+
+    Returns:
+        list: Base names of the model files, in listing order.
+    """
+    models = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            if key.endswith(MODEL_EXTENSIONS):
+                models.append(os.path.basename(key))
+    return models
+
+
+model_catalog = ModelCatalog(
+    ttl=float(os.environ.get("MODELS_CACHE_TTL", "300")),
+    marker_key=os.environ.get("MODELS_MARKER_KEY") or None,
+    stale_ttl=float(os.environ.get("MODELS_CACHE_STALE_TTL", "0")),
+)
 
+
+def disposal_csv_key(device, client_number, date, output_prefix):
+    client_no = device.split("_")[-1]
+    device = f"client-{client_number}_device-os{client_no}"
+
+    csv_name = f"{device}_date-{date}_disposal.csv"
+    return f"{output_prefix}client-{client_number}/{csv_name}"
+
+
+def csv_exists(bucket, key):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except s3.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] == "404":
+            return False
+        raise
+
+
+def model_options(models, exists):
+    options = ["Logs"] + models
+    if exists:
+        options.append("Analysis Data")
+    return options
+
+
+def batch_options(pairs, client_number, s3_bucket, output_prefix, models):
+    """
+    Resolve the options for many device/date pairs at once.
+
+    Args:
+        pairs (list): Dicts with 'device_name', 'Date' and optionally
+            'ClientNumber', which overrides the batch-level client number.
+        client_number (str): Default client number for the batch.
+        s3_bucket (str): The bucket holding the disposal CSVs.
+        output_prefix (str): The prefix of the disposal CSVs.
+        models (list): The model names, listed once for the whole batch.
+
+    Returns:
+        dict: Results keyed by '{ClientNumber}/{device_name}/{Date}'; an
+        invalid pair is keyed by its position, e.g. 'pairs[3]'. A pair that
+        could not be resolved gets an 'error' instead of options.
+    """
+    results = {}
+    lookups = {}
+    for i, pair in enumerate(pairs):
+        if not isinstance(pair, dict):
+            results[f"pairs[{i}]"] = {"error": "Each pair must be an object"}
+            continue
+        device = pair.get("device_name")
+        date = pair.get("Date")
+        number = pair.get("ClientNumber", client_number)
+        if not device or not date:
+            results[f"pairs[{i}]"] = {"error": "Device and Date are required"}
+            continue
+        lookups[f"{number}/{device}/{date}"] = disposal_csv_key(
+            device, number, date, output_prefix
+        )
+
+    def lookup(csv_key):
+        try:
+            return csv_exists(s3_bucket, csv_key), None
+        except s3.exceptions.ClientError as e:
+            return None, e.response["Error"]["Code"]
+
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        found = executor.map(instrumentation.bind(lookup), lookups.values())
+        for pair_key, csv_key, (exists, error) in zip(lookups, lookups.values(), found):
+            if error:
+                results[pair_key] = {"error": f"Could not check {csv_key}: {error}"}
+                continue
+            results[pair_key] = {
+                "options": model_options(models, exists),
+                "csv": [exists, csv_key],
+            }
+    return results
+
+
+@instrumentation.instrumented
+def handler(event, context):
     # Load from environment variables
     s3_bucket = os.environ.get("S3_BUCKET", "vendor-analysis-webapp-production")
     output_prefix = os.environ.get("OUTPUT_PREFIX", "output/")
@@ -42,48 +204,52 @@ def handler(event, context):
     date = params.get("Date")
     # date = get_next_friday(date)
 
+    # Batch mode: a POST body with a list of device/date pairs
+    if event.get("body"):
+        try:
+            body = json.loads(event["body"])
+        except ValueError:
+            body = {}
+        if isinstance(body, dict) and isinstance(body.get("pairs"), list):
+            if len(body["pairs"]) > MAX_BATCH_PAIRS:
+                return {
+                    "statusCode": 400,
+                    "headers": CORS_HEADERS,
+                    "body": json.dumps(
+                        {"error": f"At most {MAX_BATCH_PAIRS} pairs per request"}
+                    ),
+                }
+            models = model_catalog.get(models_bucket, models_prefix)
+            results = batch_options(
+                body["pairs"],
+                body.get("ClientNumber", client_number),
+                s3_bucket,
+                output_prefix,
+                models,
+            )
+            return {
+                "statusCode": 200,
+                "headers": CORS_HEADERS,
+                "body": json.dumps({"results": results}),
+            }
+
     if not device or not date:
         return {
             "statusCode": 400,
             "body": json.dumps({"error": "Device and Date are required"}),
         }
 
-    client_no = device.split("_")[-1]
-    device = f"client-{client_number}_device-os{client_no}"
-
-    csv_name = f"{device}_date-{date}_disposal.csv"
-    csv_key = f"{output_prefix}client-{client_number}/{csv_name}"
-
-    try:
-        s3.head_object(Bucket=s3_bucket, Key=csv_key)
-        csv_exists = True
-    except s3.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            csv_exists = False
-        else:
-            raise
+    csv_key = disposal_csv_key(device, client_number, date, output_prefix)
+    exists = csv_exists(s3_bucket, csv_key)
 
     # List models
-    s3_models = boto3.client("s3")
-    models = []
-    paginator = s3_models.get_paginator("list_objects_v2")
-    for page in paginator.paginate(Bucket=models_bucket, Prefix=models_prefix):
-        for obj in page.get("Contents", []):
-            key = obj["Key"]
-            if key.endswith((".pt", ".onnx", ".h5", ".engine")):
-                models.append(os.path.basename(key))
+    models = model_catalog.get(models_bucket, models_prefix)
 
     # Options to return
-    options = ["Logs"] + models
-    if csv_exists:
-        options.append("Analysis Data")
+    options = model_options(models, exists)
 
     return {
         "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,device",
-            "Access-Control-Allow-Methods": "OPTIONS,GET,POST",
-        },
-        "body": json.dumps({"options": options, "csv": [csv_exists, csv_key]}),
+        "headers": CORS_HEADERS,
+        "body": json.dumps({"options": options, "csv": [exists, csv_key]}),
     }
@@ -1,16 +1,409 @@
 import json
-import boto3
+import aws_clients
+import instrumentation
+import hashlib
 import os
 import random
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from queue_admission import DrainModel, admit
+import job_status
 
-sqs = boto3.client("sqs")
-ec2 = boto3.client("ec2")
+sqs = aws_clients.client("sqs")
+ec2 = aws_clients.client("ec2")
 
 QUEUE_URL = os.environ["QUEUE_URL"]
 QUEUE_URL_2 = os.environ["QUEUE_URL_2"]
 INSTANCE_ID = os.environ["INSTANCE_ID"]
+# Seconds a describe_instances result is reused by later submissions
+INSTANCE_STATE_TTL = float(os.environ.get("INSTANCE_STATE_TTL", "5"))
 
+# How FIFO jobs are grouped: "device" and "client" keep each one's jobs in
+# order while different ones drain in parallel, "bucket" hashes devices
+# into MESSAGE_GROUP_BUCKETS groups, "random" is the old per-message group
+MESSAGE_GROUP_STRATEGY = os.environ.get("MESSAGE_GROUP_STRATEGY", "device")
+MESSAGE_GROUP_BUCKETS = int(os.environ.get("MESSAGE_GROUP_BUCKETS", "16"))
+# What SQS accepts as a MessageGroupId: up to 128 alphanumeric or
+# punctuation characters
+VALID_GROUP_ID = re.compile(r"[A-Za-z0-9!-/:-@\[-`{-~]{1,128}")
 
+# Set to "false" when the scheduled worker_scaler owns starting instances
+START_ON_SUBMIT = os.environ.get("EC2_START_ON_SUBMIT", "true").lower() == "true"
+
+# Admission control: submissions are refused with 429 once a queue holds
+# this many visible + in-flight messages; 0 turns the limit off
+MAX_QUEUE_DEPTH = {
+    QUEUE_URL: int(os.environ.get("MAX_QUEUE_DEPTH", "0")),
+    QUEUE_URL_2: int(os.environ.get("MAX_QUEUE_DEPTH_2", "0")),
+}
+# Retry-After sent when a queue is full but its drain rate is not known yet
+DEFAULT_RETRY_AFTER = int(os.environ.get("DEFAULT_RETRY_AFTER", "60"))
+# Seconds of queue snapshots the drain-rate estimate looks back over
+DRAIN_WINDOW = float(os.environ.get("DRAIN_WINDOW", "900"))
+
+# Reused by warm invocations to issue the SQS and EC2 calls side by side
+executor = ThreadPoolExecutor(max_workers=4)
+instance_state_cache = {"state": None, "checked_at": 0.0}
+drain_models = {
+    QUEUE_URL: DrainModel(window=DRAIN_WINDOW),
+    QUEUE_URL_2: DrainModel(window=DRAIN_WINDOW),
+}
+
+
+def get_instance_state():
+    """
+    Return the worker instance's state, reusing a recent lookup.
+
+    Returns:
+        str: The EC2 state name, e.g. 'stopped' or 'running'.
+    """
+    if (
+        instance_state_cache["state"] is not None
+        and time.monotonic() - instance_state_cache["checked_at"] < INSTANCE_STATE_TTL
+    ):
+        return instance_state_cache["state"]
+    ec2_state = ec2.describe_instances(InstanceIds=[INSTANCE_ID])
+    state = ec2_state["Reservations"][0]["Instances"][0]["State"]["Name"]
+    instance_state_cache.update(state=state, checked_at=time.monotonic())
+    return state
+
+
+def start_instance():
+    ec2.start_instances(InstanceIds=[INSTANCE_ID])
+    # Our own start makes the cached state wrong; look it up again next time
+    instance_state_cache.update(state=None, checked_at=0.0)
+
+
+def ensure_worker():
+    """
+    Start the worker instance if it is stopped, unless the scaler owns it.
+
+    Returns:
+        str: The ec2_status reported to the caller.
+    """
+    instance_state = get_instance_state()
+    if instance_state != "stopped":
+        return f"EC2 instance already {instance_state}."
+    if not START_ON_SUBMIT:
+        return "EC2 instance stopped; the worker scaler will start it."
+    start_instance()
+    return "EC2 instance starting."
+
+
+def worker_status():
+    """
+    Run ensure_worker without letting an EC2 error fail the submission.
+
+    The job is queued either way, and the next submission or the worker
+    scaler starts the instance. Failing the request would make clients
+    retry and queue duplicates.
+    """
+    try:
+        return ensure_worker()
+    except Exception as e:
+        print("EC2 check failed:", str(e))
+        return f"EC2 check failed: {e}"
+
+
+def queue_attributes(queue_url):
+    return sqs.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=[
+            "ApproximateNumberOfMessages",
+            "ApproximateNumberOfMessagesNotVisible",
+        ],
+    )
+
+
+def queue_depth(queue_url):
+    """
+    Read a queue's attributes and record the depth in its drain model.
+
+    Returns:
+        tuple: (attributes dict, visible + in-flight messages).
+    """
+    attributes = queue_attributes(queue_url)["Attributes"]
+    depth = int(attributes["ApproximateNumberOfMessages"]) + int(
+        attributes["ApproximateNumberOfMessagesNotVisible"]
+    )
+    drain_models[queue_url].record(time.time(), depth)
+    return attributes, depth
+
+
+def admit_jobs(queue_url, depth, requested):
+    return admit(
+        depth,
+        MAX_QUEUE_DEPTH[queue_url],
+        drain_models[queue_url],
+        requested=requested,
+        default_retry=DEFAULT_RETRY_AFTER,
+    )
+
+
+def build_job(params, form_data):
+    """
+    Build the message a worker receives for one processing request.
+
+    Args:
+        params (dict): The request's query parameters.
+        form_data (dict): The parsed form fields from the request body.
+
+    Returns:
+        tuple: (transformed_data, model_list, job key). The key identifies
+        the job by what the caller asked for; see deduplication_id.
+    """
+    annotated = params.get("Annotated", "true").lower() == "true"
+    name = params.get("Device", "default_client_default_device")
+    start_time = params.get("Start_Time", "00:00:00")
+    end_time = params.get("End_Time", random.randint(1, 100000000))
+    date = params.get("Date", "12-01-2025")
+    email = params.get("Email", None)
+    api_test_model = params.get("api_test_model", "false").lower() == "true"
+    client_number = params.get("clientNumber", None)
+    # Parse selected models (comma-separated, max 4, distinct)
+    selected_models_param = params.get("selected_models", "")
+    optimize_report = params.get("optimize_report", "false").lower() == "true"
+    # Sorted so the same selection always gives the same message
+    model_list = sorted(
+        {m.strip() for m in selected_models_param.split(",") if m.strip()}
+    )
+    # if len(model_list) > 4:
+    #     raise ValueError("You can select a maximum of 4 distinct models.")
+    # model1, model2, model3, model4 = (model_list + [None]*4)[:4]
+    if len(model_list) == 0:
+        api_test_model = "false"
+    # 2. Parse client and device
+    if not name:
+        raise ValueError("Missing 'Device' parameter")
+    parts = name.split("_")
+    client = parts[0]
+    device = name
+
+    # 4. Merge final payload
+    transformed_data = {
+        "Client": client,
+        "Device": device,
+        "Client Number": client_number,
+        "Date": date,
+        "Start Time": start_time,
+        "End Time": end_time,
+        "Video Name": form_data.get("Video Name", ""),
+        "FPS": float(form_data.get("FPS", 10.0)),
+        "Delete Decrypted Images": form_data.get("Delete Decrypted Images", "No"),
+        "Run Inference": form_data.get("Run Inference", "No"),
+        "Graph": form_data.get("Graph", ""),
+        "Network": form_data.get("Network", ""),
+        "OID Network": form_data.get("OID Network", "No"),
+        "Fixed BBOX": form_data.get("Fixed BBOX", ["No", []]),
+        "Hybrid Encryption": form_data.get("Hybrid Encryption", "Yes"),
+        "Zipped Folder": form_data.get("Zipped Folder", False),
+        "Fullday Video": form_data.get("Fullday Video", True),
+        "Annotated": annotated,
+        "Email": email,
+        "api_test_model": api_test_model,
+        "Model": model_list,
+        "optimize_report": optimize_report,
+    }
+    job_key = deduplication_id(transformed_data, params.get("End_Time"))
+    return transformed_data, model_list, job_key
+
+
+def group_id(value):
+    """
+    Use a device or client name as a MessageGroupId, hashing names SQS
+    would reject so they still map to one stable group.
+    """
+    if VALID_GROUP_ID.fullmatch(value):
+        return value
+    return "h-" + hashlib.sha256(value.encode()).hexdigest()
+
+
+def message_group_id(transformed_data):
+    if MESSAGE_GROUP_STRATEGY == "device":
+        return group_id(transformed_data["Device"])
+    if MESSAGE_GROUP_STRATEGY == "client":
+        return group_id(transformed_data["Client"])
+    if MESSAGE_GROUP_STRATEGY == "bucket":
+        digest = hashlib.sha256(transformed_data["Device"].encode()).hexdigest()
+        return f"bucket-{int(digest, 16) % MESSAGE_GROUP_BUCKETS}"
+    return str(random.randint(1, 100000000))
+
+
+def deduplication_id(transformed_data, end_time):
+    """
+    Identify a job by its content, so a resubmitted identical form within
+    SQS's five-minute deduplication window is dropped.
+
+    Args:
+        transformed_data (dict): The job from build_job.
+        end_time: The caller's End_Time, None if omitted. It is hashed in
+            place of "End Time", whose default is random.
+    """
+    content = {**transformed_data, "End Time": end_time}
+    body = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def fifo_fields(transformed_data, dedup_id):
+    return {
+        "MessageGroupId": message_group_id(transformed_data),
+        "MessageDeduplicationId": dedup_id,
+    }
+
+
+def claim_job(transformed_data, job_key):
+    """
+    Give a job its status record before it is sent.
+
+    The job id is the job's content hash and is added to the message as
+    "Job Id" for the worker to report progress against. Each accepted
+    submission is sent with its own FIFO deduplication id: the status
+    record already refuses a job that is in flight, and resubmitting a
+    finished job within SQS's five-minute window must not be dropped.
+
+    Returns:
+        tuple: (job id, None, deduplication id) when the job should be
+        sent, or (job id, existing record, None) when the same job is
+        already queued or running. Without job tracking the id is None and
+        the job key is the deduplication id.
+    """
+    if not job_status.enabled():
+        return None, None, job_key
+    job_id = job_key
+    existing = job_status.claim(job_id, transformed_data)
+    if existing is not None:
+        return job_id, existing, None
+    transformed_data["Job Id"] = job_id
+    return job_id, None, str(uuid.uuid4())
+
+
+def send_batches(queue_url, jobs, fifo):
+    """
+    Send jobs with send_message_batch, ten per call.
+
+    Args:
+        queue_url (str): The queue to send to.
+        jobs (list): (job index, transformed_data, deduplication id) tuples.
+        fifo (bool): Whether the queue needs group and deduplication ids.
+
+    Returns:
+        dict: Job index to {"status": "queued", "MessageId": ...} or
+        {"status": "failed", "error": ...}.
+    """
+    results = {}
+    for i in range(0, len(jobs), 10):
+        entries = []
+        for index, transformed_data, dedup_id in jobs[i : i + 10]:
+            entry = {"Id": str(index), "MessageBody": json.dumps(transformed_data)}
+            if fifo:
+                entry.update(fifo_fields(transformed_data, dedup_id))
+            entries.append(entry)
+        try:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            for entry in entries:
+                results[int(entry["Id"])] = {"status": "failed", "error": str(e)}
+            continue
+        for sent in response.get("Successful", []):
+            results[int(sent["Id"])] = {
+                "status": "queued",
+                "MessageId": sent["MessageId"],
+            }
+        for failed in response.get("Failed", []):
+            results[int(failed["Id"])] = {
+                "status": "failed",
+                "error": failed.get("Message", failed["Code"]),
+            }
+    return results
+
+
+def submit_bulk(params, body):
+    """
+    Queue many jobs from one request.
+
+    The body is {"Form": {...}, "jobs": [{...}, ...]}. Each job holds query
+    parameters (Device, Date, selected_models, ...) and may carry its own
+    "Form"; both are laid over the request's query parameters and the
+    shared Form. The worker instance is checked once for the whole batch,
+    and only if a FIFO job got past admission. Jobs beyond a full queue's limit are returned as "rejected" with a
+    retry_after hint; queued jobs carry the queue's estimated wait.
+    """
+    shared_form = body.get("Form") or {}
+    results = {}
+    worker_checks = []
+    by_queue = {QUEUE_URL: [], QUEUE_URL_2: []}
+    for index, job in enumerate(body["jobs"]):
+        try:
+            job_params = {**params, **{k: v for k, v in job.items() if k != "Form"}}
+            form_data = {**shared_form, **(job.get("Form") or {})}
+            transformed_data, model_list, job_key = build_job(job_params, form_data)
+        except Exception as e:
+            results[index] = {"status": "failed", "error": str(e)}
+            continue
+        if "Analysis Data" in model_list:
+            by_queue[QUEUE_URL_2].append((index, transformed_data, job_key))
+        else:
+            by_queue[QUEUE_URL].append((index, transformed_data, job_key))
+
+    def admit_and_send(queue_url, queue_jobs, fifo):
+        if not queue_jobs:
+            return {}
+        _, depth = queue_depth(queue_url)
+        admitted, eta, retry_after = admit_jobs(queue_url, depth, len(queue_jobs))
+        if fifo and admitted:
+            worker_checks.append(executor.submit(instrumentation.bind(worker_status)))
+        to_send, duplicates, job_ids = [], {}, {}
+        for index, transformed_data, job_key in queue_jobs[:admitted]:
+            job_id, existing, dedup_id = claim_job(transformed_data, job_key)
+            job_ids[index] = job_id
+            if existing is None:
+                to_send.append((index, transformed_data, dedup_id))
+            else:
+                duplicates[index] = {
+                    "status": "duplicate",
+                    "job_id": job_id,
+                    "job": existing,
+                }
+        sent = send_batches(queue_url, to_send, fifo)
+        drain_models[queue_url].sent(
+            sum(r["status"] == "queued" for r in sent.values())
+        )
+        for index, result in sent.items():
+            if job_ids[index] is not None:
+                result["job_id"] = job_ids[index]
+                if result["status"] == "failed":
+                    job_status.set_status(job_ids[index], "failed", error=result["error"])
+            if result["status"] == "queued":
+                result["estimated_wait_seconds"] = eta
+        sent.update(duplicates)
+        for index, _, _ in queue_jobs[admitted:]:
+            sent[index] = {
+                "status": "rejected",
+                "error": "Queue is full.",
+                "retry_after": retry_after,
+            }
+        return sent
+
+    send = instrumentation.bind(admit_and_send)
+    fifo_sent = executor.submit(send, QUEUE_URL, by_queue[QUEUE_URL], True)
+    standard_sent = executor.submit(
+        send, QUEUE_URL_2, by_queue[QUEUE_URL_2], False
+    )
+
+    results.update(fifo_sent.result())
+    results.update(standard_sent.result())
+    ec2_action = worker_checks[0].result() if worker_checks else "Not needed"
+    jobs = [{"index": index, **results[index]} for index in sorted(results)]
+    return {
+        "message": f"{sum(j['status'] == 'queued' for j in jobs)} of {len(jobs)} jobs queued.",
+        "ec2_status": ec2_action,
+        "jobs": jobs,
+    }
+
+
+@instrumentation.instrumented
 def handler(event, context):
     try:
         print("Received event:", json.dumps(event))
@@ -18,32 +411,6 @@ def handler(event, context):
         # 1. Extract query parameters
         params = event.get("queryStringParameters") or {}
 
-        annotated = params.get("Annotated", "true").lower() == "true"
-        name = params.get("Device", "default_client_default_device")
-        start_time = params.get("Start_Time", "00:00:00")
-        end_time = params.get("End_Time", random.randint(1, 100000000))
-        date = params.get("Date", "12-01-2025")
-        email = params.get("Email", None)
-        api_test_model = params.get("api_test_model", "false").lower() == "true"
-        client_number = params.get("clientNumber", None)
-        # Parse selected models (comma-separated, max 4, distinct)
-        selected_models_param = params.get("selected_models", "")
-        optimize_report = params.get("optimize_report", "false").lower() == "true"
-        model_list = list(
-            {m.strip() for m in selected_models_param.split(",") if m.strip()}
-        )
-        # if len(model_list) > 4:
-        #     raise ValueError("You can select a maximum of 4 distinct models.")
-        # model1, model2, model3, model4 = (model_list + [None]*4)[:4]
-        if len(model_list) == 0:
-            api_test_model = "false"
-        # 2. Parse client and device
-        if not name:
-            raise ValueError("Missing 'Device' parameter")
-        parts = name.split("_")
-        client = parts[0]
-        device = name
-
         # 3. Parse optional body for POST
         form_data = {}
         if event.get("body"):
@@ -52,76 +419,93 @@ def handler(event, context):
             except Exception:
                 print("Invalid JSON body; ignoring.")
 
-        # 4. Merge final payload
-        transformed_data = {
-            "Client": client,
-            "Device": device,
-            "Client Number": client_number,
-            "Date": date,
-            "Start Time": start_time,
-            "End Time": end_time,
-            "Video Name": form_data.get("Video Name", ""),
-            "FPS": float(form_data.get("FPS", 10.0)),
-            "Delete Decrypted Images": form_data.get("Delete Decrypted Images", "No"),
-            "Run Inference": form_data.get("Run Inference", "No"),
-            "Graph": form_data.get("Graph", ""),
-            "Network": form_data.get("Network", ""),
-            "OID Network": form_data.get("OID Network", "No"),
-            "Fixed BBOX": form_data.get("Fixed BBOX", ["No", []]),
-            "Hybrid Encryption": form_data.get("Hybrid Encryption", "Yes"),
-            "Zipped Folder": form_data.get("Zipped Folder", False),
-            "Fullday Video": form_data.get("Fullday Video", True),
-            "Annotated": annotated,
-            "Email": email,
-            "api_test_model": api_test_model,
-            "Model": model_list,
-            "optimize_report": optimize_report,
-        }
-        if "Analysis Data" in model_list:
-            response = sqs.get_queue_attributes(
-                QueueUrl=QUEUE_URL_2,
-                AttributeNames=[
-                    "ApproximateNumberOfMessages",
-                    "ApproximateNumberOfMessagesNotVisible",
-                ],
-            )
+        if isinstance(form_data.get("jobs"), list):
+            result = submit_bulk(params, form_data)
+            statuses = {job["status"] for job in result["jobs"]}
+            if statuses == {"rejected"}:
+                retry_after = max(job["retry_after"] for job in result["jobs"])
+                return {
+                    "statusCode": 429,
+                    "headers": {
+                        "Access-Control-Allow-Origin": "*",
+                        "Retry-After": str(retry_after),
+                    },
+                    "body": json.dumps(result),
+                }
+            return {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps(result),
+            }
 
-        # 5. Get SQS Queue status
-        else:
-            response = sqs.get_queue_attributes(
-                QueueUrl=QUEUE_URL,
-                AttributeNames=[
-                    "ApproximateNumberOfMessages",
-                    "ApproximateNumberOfMessagesNotVisible",
-                ],
-            )
+        transformed_data, model_list, job_key = build_job(params, form_data)
+        # 5. Get SQS Queue status; a full queue refuses the job
+        queue_url = QUEUE_URL_2 if "Analysis Data" in model_list else QUEUE_URL
+        attributes, depth = queue_depth(queue_url)
+        admitted, eta, retry_after = admit_jobs(queue_url, depth, 1)
+        counts = {
+            "ApproximateNumberOfMessages (Visible)": attributes[
+                "ApproximateNumberOfMessages"
+            ],
+            "ApproximateNumberOfMessagesNotVisible (In-Flight)": attributes[
+                "ApproximateNumberOfMessagesNotVisible"
+            ],
+        }
+        if not admitted:
+            return {
+                "statusCode": 429,
+                "headers": {
+                    "Access-Control-Allow-Origin": "*",
+                    "Retry-After": str(retry_after),
+                },
+                "body": json.dumps(
+                    {"error": "Queue is full.", "retry_after": retry_after, **counts}
+                ),
+            }
 
-        # 6. EC2 startup logic
-        ec2_state = ec2.describe_instances(InstanceIds=[INSTANCE_ID])
-        instance_state = ec2_state["Reservations"][0]["Instances"][0]["State"]["Name"]
-        if "Analysis Data" not in model_list:
-            if instance_state == "stopped":
+        # 6. EC2 startup logic, only for jobs the queue accepted; it runs
+        # alongside the claim and send
+        worker_check = (
+            executor.submit(instrumentation.bind(worker_status))
+            if queue_url == QUEUE_URL
+            else None
+        )
 
-                ec2.start_instances(InstanceIds=[INSTANCE_ID])
-                ec2_action = "EC2 instance starting."
-            else:
+        def ec2_status():
+            return worker_check.result() if worker_check else "Not needed"
 
-                ec2_action = f"EC2 instance already {instance_state}."
+        job_id, existing, dedup_id = claim_job(transformed_data, job_key)
+        tracking = {} if job_id is None else {"job_id": job_id}
+        if existing is not None:
+            # The same job is still queued or running; poll /jobstatus for it
+            return {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps(
+                    {
+                        "message": "Job already queued.",
+                        "ec2_status": ec2_status(),
+                        **counts,
+                        **tracking,
+                        "job": existing,
+                    }
+                ),
+            }
 
-            # 7. Send to SQS
-            print("Sending to SQS:", transformed_data)
-        if "Analysis Data" not in model_list:
-            sqs.send_message(
-                QueueUrl=QUEUE_URL,
-                MessageBody=json.dumps(transformed_data),
-                MessageGroupId=str(random.randint(1, 100000000)),
-            )
-        else:
+        # 7. Send to SQS
+        send_fields = {}
+        if queue_url == QUEUE_URL:
+            send_fields = fifo_fields(transformed_data, dedup_id)
+        print("Sending to SQS:", transformed_data)
+        try:
             sqs.send_message(
-                QueueUrl=QUEUE_URL_2,
-                MessageBody=json.dumps(transformed_data),
+                QueueUrl=queue_url, MessageBody=json.dumps(transformed_data), **send_fields
             )
-            ec2_action = "Not needed"
+        except Exception as e:
+            if job_id is not None:
+                job_status.set_status(job_id, "failed", error=str(e))
+            raise
+        drain_models[queue_url].sent()
 
         return {
             "statusCode": 200,
@@ -129,13 +513,10 @@ def handler(event, context):
             "body": json.dumps(
                 {
                     "message": "Form received and processed.",
-                    "ec2_status": ec2_action,
-                    "ApproximateNumberOfMessages (Visible)": response["Attributes"][
-                        "ApproximateNumberOfMessages"
-                    ],
-                    "ApproximateNumberOfMessagesNotVisible (In-Flight)": response[
-                        "Attributes"
-                    ]["ApproximateNumberOfMessagesNotVisible"],
+                    "ec2_status": ec2_status(),
+                    **counts,
+                    "estimated_wait_seconds": eta,
+                    **tracking,
                     "Form": transformed_data,
                 }
             ),
@@ -0,0 +1,36 @@
+import time
+
+
+def batch_get_items(dynamodb, table_name, keys, retries=5, **projection):
+    """
+    Read many items with BatchGetItem, 100 keys per call.
+
+    Keys DynamoDB leaves unprocessed are retried with exponential backoff.
+
+    Args:
+        dynamodb: A boto3 DynamoDB service resource.
+        table_name (str): The table to read.
+        keys (list): Key dicts, without duplicates.
+        retries (int): Retries per chunk before giving up.
+        **projection: ProjectionExpression / ExpressionAttributeNames.
+
+    Returns:
+        list: The items found, in no particular order.
+    """
+    items = []
+    for i in range(0, len(keys), 100):
+        request = {table_name: {"Keys": keys[i : i + 100], **projection}}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response["Responses"].get(table_name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if request:
+                attempt += 1
+                if attempt > retries:
+                    raise RuntimeError(
+                        f"{len(request[table_name]['Keys'])} keys unprocessed "
+                        f"after {retries} retries"
+                    )
+                time.sleep(min(0.05 * 2**attempt, 1.0))
+    return items
@@ -1,43 +1,159 @@
-import boto3
+import aws_clients
+import instrumentation
 import logging
 import json
-from boto3.dynamodb.conditions import Key
+import os
+from dynamo_batch import batch_get_items
+from warm_cache import MISSING, WarmCache
 
+dynamodb = aws_clients.resource("dynamodb")
 
+TABLE_NAME = os.environ.get("DYNAMODB_TABLE") or "DeviceInformation"
+table = aws_clients.lazy(lambda: dynamodb.Table(TABLE_NAME))
+
+# Only the one nested attribute the handler returns is read back
+PROJECTION = {
+    "ProjectionExpression": "#map.graph_folder",
+    "ExpressionAttributeNames": {"#map": "Python Map"},
+}
+# Batch responses need the key back to tell the items apart
+BATCH_PROJECTION = {
+    "ProjectionExpression": "DeviceName, #map.graph_folder",
+    "ExpressionAttributeNames": {"#map": "Python Map"},
+}
+BATCH_RETRIES = int(os.environ.get("DEVICE_BATCH_RETRIES", "5"))
+
+# Stands for a device that is not in the table, as opposed to one that is
+# but has no graph_folder (None)
+NOT_FOUND = object()
+
+# Warm-container LRU of device name -> graph_folder. Devices missing from
+# the table are cached as NOT_FOUND so repeated lookups of an unknown name
+# do not reach DynamoDB either.
+device_cache = WarmCache(
+    maxsize=int(os.environ.get("DEVICE_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("DEVICE_CACHE_TTL", "300")),
+)
+
+
+def graph_folder_of(item):
+    if item is None:
+        return NOT_FOUND
+    return item.get("Python Map", {}).get("graph_folder")
+
+
+def fetch_graph_folder(device_name):
+    """
+    Read one device's graph_folder with a projected GetItem.
+
+    Returns:
+        str: The graph_folder, None if the device has none, or NOT_FOUND
+        if the device is not in the table.
+    """
+    response = table.get_item(Key={"DeviceName": device_name}, **PROJECTION)
+    return graph_folder_of(response.get("Item"))
+
+
+def fetch_graph_folders(device_names):
+    """
+    Read many devices' graph_folder with BatchGetItem.
+
+    Keys DynamoDB leaves unprocessed are retried with exponential backoff,
+    up to BATCH_RETRIES times.
+
+    Args:
+        device_names (list): Distinct device names.
+
+    Returns:
+        dict: Device name to graph_folder for the devices that exist.
+    """
+    keys = [{"DeviceName": name} for name in device_names]
+    items = batch_get_items(
+        dynamodb, TABLE_NAME, keys, retries=BATCH_RETRIES, **BATCH_PROJECTION
+    )
+    return {item["DeviceName"]: graph_folder_of(item) for item in items}
+
+
+def lookup_graph_folders(device_names):
+    """
+    Resolve device names to graph folders, from the cache where possible.
+
+    Returns:
+        dict: Device name to graph_folder, NOT_FOUND for unknown devices.
+    """
+    result, missing = {}, []
+    for name in dict.fromkeys(device_names):
+        graph_folder = device_cache.get(name, MISSING)
+        if graph_folder is not MISSING:
+            result[name] = graph_folder
+        else:
+            missing.append(name)
+    if len(missing) == 1:
+        fetched = {missing[0]: fetch_graph_folder(missing[0])}
+    else:
+        fetched = fetch_graph_folders(missing)
+    for name in missing:
+        result[name] = fetched.get(name, NOT_FOUND)
+        device_cache.put(name, result[name])
+    return result
+
+
+def get_graph_folders(device_names):
+    """
+    Returns:
+        dict: Device name to graph_folder, None for unknown devices.
+    """
+    return {
+        name: None if graph_folder is NOT_FOUND else graph_folder
+        for name, graph_folder in lookup_graph_folders(device_names).items()
+    }
+
+
+@instrumentation.instrumented
 def handler(event, context):
     """
     AWS Lambda handler to fetch data from DynamoDB for a given device.
 
     Args:
-        event (dict): The event dict, expects 'device_name' key.
+        event (dict): The event dict, expects a 'device_name' query
+            parameter, or 'device_names' as a comma-separated list.
         context: Lambda context (unused).
 
     Returns:
-        dict: Result with 'graph_folder' or error message.
+        dict: Result with 'graph_folder' (or 'graph_folders' keyed by device
+        name for 'device_names') or error message.
     """
-    device_name = event["queryStringParameters"].get("device_name")
-    print(device_name)
-    if not device_name:
-        logging.error("Missing 'device_name' in event")
-        {
-            "statusCode": 200,
-            "headers": {"Access-Control-Allow-Origin": "*"},
-            "body": {"graph_folder": "None"},
-        }
-
-        # return {"error": "Missing 'device_name' in event"}
+    params = event.get("queryStringParameters") or {}
+    device_names = [
+        name.strip() for name in params.get("device_names", "").split(",") if name.strip()
+    ]
+    device_name = params.get("device_name")
+    print(device_name or device_names)
     try:
-        logging.info(f"Device name: {device_name}")
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table("DeviceInformation")
+        if device_names:
+            return {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"graph_folders": get_graph_folders(device_names)}),
+            }
 
-        response = table.query(KeyConditionExpression=Key("DeviceName").eq(device_name))
+        if not device_name:
+            logging.error("Missing 'device_name' in event")
+            return {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"graph_folder": "None"}),
+            }
 
-        items = response.get("Items", [])
-        if not items:
+        logging.info(f"Device name: {device_name}")
+        graph_folder = lookup_graph_folders([device_name])[device_name]
+        if graph_folder is NOT_FOUND:
             logging.warning(f"No data found for device: {device_name}")
-            return {"error": f"No data found for device: {device_name}"}
-        graph_folder = items[0].get("Python Map", {}).get("graph_folder")
+            return {
+                "statusCode": 404,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"error": f"No data found for device: {device_name}"}),
+            }
         print(graph_folder)
         return {
             "statusCode": 200,
@@ -49,5 +165,5 @@ def handler(event, context):
         return {
             "statusCode": 500,
             "headers": {"Access-Control-Allow-Origin": "*"},
-            "body": {"error": str(e)},
+            "body": json.dumps({"error": str(e)}),
         }
@@ -0,0 +1,35 @@
+from collections import namedtuple
+
+FolderSize = namedtuple("FolderSize", ["bytes", "pages", "objects", "exceeded"])
+
+
+def folder_size(s3, bucket, prefix, threshold=None):
+    """
+    Stream the pages under a prefix and sum object sizes.
+
+    Paging stops as soon as the running total passes ``threshold``, so a
+    busy day is never listed further than needed to prove it qualifies.
+
+    Args:
+        s3: A boto3 S3 client.
+        bucket (str): The bucket to list.
+        prefix (str): The folder prefix to size.
+        threshold (int): Optional size in bytes to stop at once exceeded.
+
+    Returns:
+        FolderSize: Bytes seen, pages fetched, objects seen and whether the
+        threshold was exceeded.
+    """
+    total = 0
+    pages = 0
+    objects = 0
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        pages += 1
+        for obj in page.get("Contents", []):
+            total += obj["Size"]
+            objects += 1
+        if threshold is not None and total > threshold:
+            return FolderSize(total, pages, objects, True)
+    exceeded = threshold is not None and total > threshold
+    return FolderSize(total, pages, objects, exceeded)
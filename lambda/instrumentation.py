@@ -0,0 +1,295 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from botocore.utils import determine_content_length
+
+# "off" leaves clients unhooked and handlers unwrapped
+INSTRUMENTATION = os.environ.get("INSTRUMENTATION", "on")
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CdkApp")
+# Adds a Server-Timing header with the per-operation totals to responses
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "false").lower() == "true"
+
+# Errors are exceptions and 5xx responses. 4xx responses are counted
+# apart as ClientErrors, since many are expected (a 404 probe, a 429 the
+# caller retries). A 304 answering IfNoneMatch is a success.
+METRICS = [
+    {"Name": "Calls", "Unit": "Count"},
+    {"Name": "Errors", "Unit": "Count"},
+    {"Name": "ClientErrors", "Unit": "Count"},
+    {"Name": "Latency", "Unit": "Milliseconds"},
+    {"Name": "BytesSent", "Unit": "Bytes"},
+    {"Name": "BytesReceived", "Unit": "Bytes"},
+]
+LATENCY_METRIC = [{"Name": "Latency", "Unit": "Milliseconds"}]
+# EMF takes at most this many values per metric in one record
+MAX_VALUES = 100
+
+class Invocation:
+    """
+    The calls made on behalf of one handler invocation.
+
+    Each invocation gets a new one rather than clearing the last, so a call
+    that finishes after its invocation returned (a background cache
+    refresh, an executor task nobody waited for) is dropped instead of
+    being counted against the next one.
+    """
+
+    def __init__(self):
+        # Operation name -> totals
+        self.operations = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def record(self, operation, seconds, sent=0, received=0, error=False, client_error=False):
+        with self.lock:
+            if self.closed:
+                return
+            totals = self.operations.get(operation)
+            if totals is None:
+                totals = self.operations[operation] = {
+                    "Calls": 0,
+                    "Errors": 0,
+                    "ClientErrors": 0,
+                    "Latency": [],
+                    "BytesSent": 0,
+                    "BytesReceived": 0,
+                }
+            totals["Calls"] += 1
+            totals["Errors"] += int(error)
+            totals["ClientErrors"] += int(client_error)
+            # One value per call, so CloudWatch statistics are per call
+            totals["Latency"].append(round(seconds * 1000, 3))
+            totals["BytesSent"] += sent
+            totals["BytesReceived"] += received
+
+    def close(self):
+        """Stop recording and return the totals."""
+        with self.lock:
+            self.closed = True
+            return self.operations
+
+
+# The invocation the handler is running. Worker threads that were handed
+# one with bind() record into that instead.
+current = None
+bound = threading.local()
+
+
+def enabled():
+    return INSTRUMENTATION != "off"
+
+
+def active():
+    return getattr(bound, "invocation", None) or current
+
+
+def bind(fn):
+    """
+    Tie ``fn`` to the invocation active now, for running on another thread.
+
+    Args:
+        fn (callable): A function to pass to an executor or Thread.
+
+    Returns:
+        callable: ``fn`` wrapped so the calls it makes are recorded
+        against the invocation that handed it off, whenever it runs.
+    """
+    invocation = active()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        previous = getattr(bound, "invocation", None)
+        bound.invocation = invocation
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            bound.invocation = previous
+
+    return run
+
+
+def record(operation, seconds, invocation=None, **kwargs):
+    invocation = invocation or active()
+    if invocation is not None:
+        invocation.record(operation, seconds, **kwargs)
+
+
+@contextmanager
+def timed(operation):
+    """
+    Record the enclosed block as one call of ``operation``, e.g. a database
+    round trip that botocore's events do not see.
+    """
+    invocation = active()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record(operation, time.perf_counter() - started, invocation, error=True)
+        raise
+    record(operation, time.perf_counter() - started, invocation)
+
+
+def operation_name(model):
+    return f"{model.service_model.service_name}.{model.name}"
+
+
+def body_size(body):
+    if isinstance(body, dict):
+        # Query-protocol services (EC2) send form-encoded parameters
+        return len(urlencode(body))
+    # Seekable uploads are measured without being read
+    return determine_content_length(body) or 0
+
+
+def before_call(model, params, context, **kwargs):
+    context["instrumentation_invocation"] = active()
+    context["instrumentation_started"] = time.perf_counter()
+    context["instrumentation_sent"] = body_size(params.get("body"))
+
+
+def response_size(http_response, model):
+    length = (http_response.headers or {}).get("content-length")
+    if length:
+        return int(length)
+    # Reading a streaming body here would consume it before the caller can
+    if model.has_streaming_output:
+        return 0
+    return len(http_response.content or b"")
+
+
+def after_call(http_response, model, context, **kwargs):
+    started = context.pop("instrumentation_started", None)
+    if started is None:
+        return
+    status = http_response.status_code
+    record(
+        operation_name(model),
+        time.perf_counter() - started,
+        context.pop("instrumentation_invocation", None),
+        sent=context.pop("instrumentation_sent", 0),
+        received=response_size(http_response, model),
+        error=status >= 500,
+        client_error=400 <= status < 500,
+    )
+
+
+def after_call_error(model, context, **kwargs):
+    started = context.pop("instrumentation_started", None)
+    if started is not None:
+        invocation = context.pop("instrumentation_invocation", None)
+        record(operation_name(model), time.perf_counter() - started, invocation, error=True)
+
+
+def instrument_client(client):
+    """
+    Hook a boto3 client's before/after-call events so each API call it makes
+    is counted and timed.
+    """
+    if not enabled():
+        return client
+    events = client.meta.events
+    events.register("before-call", before_call, unique_id="instrumentation-before")
+    events.register("after-call", after_call, unique_id="instrumentation-after")
+    events.register(
+        "after-call-error", after_call_error, unique_id="instrumentation-error"
+    )
+    return client
+
+
+def emf_record(function, operation, timestamp, metrics, values):
+    return {
+        "_aws": {
+            "Timestamp": timestamp,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Function", "Operation"]],
+                    "Metrics": metrics,
+                }
+            ],
+        },
+        "Function": function,
+        "Operation": operation,
+        **values,
+    }
+
+
+def emf_lines(function, totals, timestamp):
+    """
+    Build CloudWatch Embedded Metric Format records, one per operation.
+
+    Latency is a value array with one entry per call. An operation called
+    more than MAX_VALUES times gets further records holding only Latency.
+    """
+    lines = []
+    for operation, values in sorted(totals.items()):
+        latencies = values["Latency"]
+        lines.append(
+            emf_record(
+                function,
+                operation,
+                timestamp,
+                METRICS,
+                {**values, "Latency": latencies[:MAX_VALUES]},
+            )
+        )
+        for i in range(MAX_VALUES, len(latencies), MAX_VALUES):
+            lines.append(
+                emf_record(
+                    function,
+                    operation,
+                    timestamp,
+                    LATENCY_METRIC,
+                    {"Latency": latencies[i : i + MAX_VALUES]},
+                )
+            )
+    return lines
+
+
+def server_timing(totals):
+    return ", ".join(
+        f'{operation};dur={sum(values["Latency"]):.1f};desc="{values["Calls"]} calls"'
+        for operation, values in sorted(totals.items())
+    )
+
+
+def instrumented(handler):
+    """
+    Wrap a Lambda handler to collect the invocation's AWS and database
+    calls and print them as EMF lines when it returns.
+    """
+    if not enabled():
+        return handler
+    function = handler.__module__
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global current
+        invocation = current = Invocation()
+        started = time.perf_counter()
+        failed = False
+        try:
+            response = handler(event, context)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            record("handler", time.perf_counter() - started, invocation, error=failed)
+            totals = invocation.close()
+            timestamp = int(time.time() * 1000)
+            for line in emf_lines(function, totals, timestamp):
+                print(json.dumps(line))
+        if SERVER_TIMING and isinstance(response, dict) and "statusCode" in response:
+            headers = dict(response.get("headers") or {})
+            headers["Server-Timing"] = server_timing(totals)
+            headers["Timing-Allow-Origin"] = "*"
+            response = {**response, "headers": headers}
+        return response
+
+    return wrapper
@@ -0,0 +1,201 @@
+import aws_clients
+import instrumentation
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import unquote_plus
+
+s3 = aws_clients.client("s3")
+
+INVENTORY_BUCKET = os.environ.get("INVENTORY_BUCKET", "")
+# Comma-separated "{destination-prefix}/{source-bucket}/{config-id}/" roots,
+# one per -pilot bucket with an inventory configuration.
+INVENTORY_PREFIXES = os.environ.get("INVENTORY_PREFIXES", "")
+DATE_INDEX_PREFIX = os.environ.get("DATE_INDEX_PREFIX", "date-index/")
+SIZE_THRESHOLD = int(float(os.environ.get("SIZE_THRESHOLD_MB", "20")) * 1024 * 1024)
+
+
+def parse_frame_key(key):
+    """
+    Split an all_frames key into its client, device and date.
+
+    Args:
+        key (str): An object key such as
+            'client1-raw-data/client1_dev/2025-03-01/all_frames/all_frames/1.jpg'.
+
+    Returns:
+        tuple: (client, device, date), or None for any other key.
+    """
+    parts = key.split("/")
+    if len(parts) < 6 or parts[3:5] != ["all_frames", "all_frames"]:
+        return None
+    if not parts[0].endswith("-raw-data"):
+        return None
+    return parts[0][: -len("-raw-data")], parts[1], parts[2]
+
+
+def latest_manifest(bucket, prefix):
+    """
+    Find the newest manifest.json under an inventory configuration root.
+
+    Inventory deliveries are folders named by their creation time, so the
+    last one in lexical order is the newest.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    folders = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        folders.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    deliveries = sorted(f for f in folders if f.rstrip("/").endswith("Z"))
+    if not deliveries:
+        return None
+    return f"{deliveries[-1]}manifest.json"
+
+
+def iter_csv_rows(bucket, key, schema):
+    key_index = schema.index("Key")
+    size_index = schema.index("Size")
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    with gzip.GzipFile(fileobj=body) as raw:
+        for row in csv.reader(io.TextIOWrapper(raw, encoding="utf-8")):
+            if not row[size_index]:
+                continue
+            yield unquote_plus(row[key_index]), int(row[size_index])
+
+
+def iter_parquet_rows(bucket, key):
+    # pyarrow is only needed for Parquet inventories, so it is imported here
+    # rather than required by every function in the bundle.
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryFile() as f:
+        s3.download_fileobj(bucket, key, f)
+        f.seek(0)
+        parquet = pq.ParquetFile(f)
+        for batch in parquet.iter_batches(columns=["key", "size"]):
+            for row_key, size in zip(batch.column(0), batch.column(1)):
+                if size.as_py() is not None:
+                    yield row_key.as_py(), size.as_py()
+
+
+def iter_inventory_rows(bucket, manifest_key):
+    """
+    Stream (key, size) pairs from every data file listed in a manifest.
+
+    Args:
+        bucket (str): The inventory destination bucket.
+        manifest_key (str): Key of the delivery's manifest.json.
+
+    Yields:
+        tuple: (object key, size in bytes).
+    """
+    manifest = json.loads(s3.get_object(Bucket=bucket, Key=manifest_key)["Body"].read())
+    file_format = manifest["fileFormat"].upper()
+    schema = [field.strip() for field in manifest["fileSchema"].split(",")]
+    for data_file in manifest["files"]:
+        if file_format == "CSV":
+            yield from iter_csv_rows(bucket, data_file["key"], schema)
+        elif file_format == "PARQUET":
+            yield from iter_parquet_rows(bucket, data_file["key"])
+        else:
+            raise ValueError(f"Unsupported inventory format: {manifest['fileFormat']}")
+
+
+def aggregate(rows):
+    """
+    Total frame bytes per (client, device, date) in a single pass.
+
+    Memory grows with the number of device-days, not with the number of
+    objects in the inventory.
+    """
+    totals = defaultdict(int)
+    for key, size in rows:
+        parsed = parse_frame_key(key)
+        if parsed:
+            totals[parsed] += size
+    return totals
+
+
+def build_indexes(totals, snapshot_date):
+    """
+    Group device-day totals into date indexes in the availabledates format.
+
+    Args:
+        totals (dict): (client, device, date) to bytes.
+        snapshot_date (datetime): When the inventory was taken. That day is
+            still being written, so only earlier days are marked as indexed.
+
+    Returns:
+        dict: (client, device) to index dict.
+    """
+    start_of_year = f"{snapshot_date.year}-01-01"
+    last_indexed = (snapshot_date - timedelta(days=1)).strftime("%Y-%m-%d")
+    indexes = {}
+    for (client, device, date), size in totals.items():
+        if not start_of_year <= date <= last_indexed:
+            continue
+        index = indexes.setdefault(
+            (client, device),
+            {"threshold": SIZE_THRESHOLD, "last_indexed": last_indexed, "days": {}},
+        )
+        index["days"][date] = size
+    return indexes
+
+
+def write_index(client, device, index):
+    bucket = f"{client}-pilot"
+    key = f"{DATE_INDEX_PREFIX}{device}.json"
+    try:
+        current = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except s3.exceptions.ClientError as e:
+        # 404 when the key is missing; without ListBucket it would be a 403
+        if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+            raise
+        current = None
+    # Keep anything the handler indexed after the snapshot was taken.
+    if current and current.get("threshold") == index["threshold"]:
+        for date, size in current["days"].items():
+            if date > index["last_indexed"]:
+                index["days"][date] = size
+        index["last_indexed"] = max(index["last_indexed"], current["last_indexed"])
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(index, sort_keys=True),
+        ContentType="application/json",
+    )
+
+
+def manifest_keys(event):
+    if event.get("Records"):
+        return [
+            (r["s3"]["bucket"]["name"], unquote_plus(r["s3"]["object"]["key"]))
+            for r in event["Records"]
+        ]
+    if event.get("manifest_key"):
+        return [(event.get("bucket", INVENTORY_BUCKET), event["manifest_key"])]
+    keys = []
+    for prefix in filter(None, INVENTORY_PREFIXES.split(",")):
+        key = latest_manifest(INVENTORY_BUCKET, prefix.strip())
+        if key:
+            keys.append((INVENTORY_BUCKET, key))
+    return keys
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    written = 0
+    for bucket, manifest_key in manifest_keys(event):
+        print(f"Aggregating inventory s3://{bucket}/{manifest_key}")
+        delivery = manifest_key.rstrip("/").split("/")[-2]
+        snapshot_date = datetime.strptime(delivery[:10], "%Y-%m-%d")
+        totals = aggregate(iter_inventory_rows(bucket, manifest_key))
+        for (client, device), index in build_indexes(totals, snapshot_date).items():
+            write_index(client, device, index)
+            written += 1
+    print(f"Wrote {written} date indexes")
+    return {"indexes": written}
@@ -0,0 +1,181 @@
+import aws_clients
+import instrumentation
+import json
+import os
+import time
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from dynamo_batch import batch_get_items
+
+dynamodb = aws_clients.resource("dynamodb")
+
+# Empty turns job tracking off; check_queue then sends without job ids
+JOB_STATUS_TABLE = os.environ.get("JOB_STATUS_TABLE", "")
+table = (
+    aws_clients.lazy(lambda: dynamodb.Table(JOB_STATUS_TABLE)) if JOB_STATUS_TABLE else None
+)
+
+STATUSES = ("queued", "running", "done", "failed")
+# A queued or running job older than this no longer blocks resubmitting it.
+# The default matches SQS's 5-minute deduplication window, so a record left
+# "queued" (no worker reporting, or a send that never happened) holds a
+# resubmission back no longer than the FIFO queue itself would.
+RESUBMIT_AFTER = int(os.environ.get("JOB_RESUBMIT_AFTER", "300"))
+# Records are removed by DynamoDB's TTL this long after submission
+JOB_STATUS_TTL = int(os.environ.get("JOB_STATUS_TTL", str(30 * 86400)))
+
+# What /jobstatus returns; ExpiresAt and SubmittedEpoch stay internal
+PROJECTION = {
+    "ProjectionExpression": "JobId, #s, Device, SubmittedAt, UpdatedAt, #e",
+    "ExpressionAttributeNames": {"#s": "Status", "#e": "Error"},
+}
+
+
+def enabled():
+    return table is not None
+
+
+def isoformat(now):
+    return datetime.fromtimestamp(now, timezone.utc).isoformat()
+
+
+def claim(job_id, transformed_data, now=None):
+    """
+    Record a job as queued unless the same job is already in flight.
+
+    Job ids come from the job's content, so a resubmitted form maps to the
+    same record. It is only queued again once the earlier run is done or
+    failed, or has been pending for longer than RESUBMIT_AFTER.
+
+    Returns:
+        dict: None if the job was claimed, otherwise the existing record.
+    """
+    now = time.time() if now is None else now
+    try:
+        table.put_item(
+            Item={
+                "JobId": job_id,
+                "Status": "queued",
+                "Device": transformed_data.get("Device"),
+                "SubmittedAt": isoformat(now),
+                "UpdatedAt": isoformat(now),
+                "SubmittedEpoch": int(now),
+                "ExpiresAt": int(now) + JOB_STATUS_TTL,
+            },
+            ConditionExpression=(
+                "attribute_not_exists(JobId) OR #s IN (:done, :failed) "
+                "OR SubmittedEpoch < :stale"
+            ),
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={
+                ":done": "done",
+                ":failed": "failed",
+                ":stale": int(now) - RESUBMIT_AFTER,
+            },
+        )
+        return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    return get_job(job_id)
+
+
+def set_status(job_id, status, error=None, now=None):
+    """
+    Move a job to a new status. Called by the workers as they pick jobs up
+    and finish them, and by check_queue when a send fails.
+    """
+    if status not in STATUSES:
+        raise ValueError(f"Unknown job status: {status}")
+    now = time.time() if now is None else now
+    update = "SET #s = :s, UpdatedAt = :now"
+    values = {":s": status, ":now": isoformat(now)}
+    if error is not None:
+        update += ", #e = :e"
+        values[":e"] = error
+    table.update_item(
+        Key={"JobId": job_id},
+        UpdateExpression=update,
+        ExpressionAttributeNames={
+            "#s": "Status",
+            **({"#e": "Error"} if error is not None else {}),
+        },
+        ExpressionAttributeValues=values,
+    )
+
+
+def get_job(job_id):
+    response = table.get_item(Key={"JobId": job_id}, **PROJECTION)
+    return response.get("Item")
+
+
+def get_jobs(job_ids):
+    """
+    Returns:
+        dict: Job id to its record, None for unknown ids.
+    """
+    job_ids = list(dict.fromkeys(job_ids))
+    items = batch_get_items(
+        dynamodb, JOB_STATUS_TABLE, [{"JobId": i} for i in job_ids], **PROJECTION
+    )
+    found = {item["JobId"]: item for item in items}
+    return {job_id: found.get(job_id) for job_id in job_ids}
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """
+    Report job status: ?job_id=<id> for one job, ?job_ids=a,b or a POST
+    body {"job_ids": [...]} for many.
+    """
+    params = event.get("queryStringParameters") or {}
+    job_ids = [i.strip() for i in params.get("job_ids", "").split(",") if i.strip()]
+    try:
+        if event.get("body"):
+            try:
+                body = json.loads(event["body"])
+            except ValueError:
+                body = None
+            requested = body.get("job_ids", []) if isinstance(body, dict) else None
+            if not isinstance(requested, list) or not all(
+                isinstance(job_id, str) for job_id in requested
+            ):
+                return {
+                    "statusCode": 400,
+                    "headers": {"Access-Control-Allow-Origin": "*"},
+                    "body": json.dumps({"error": 'Expected a body like {"job_ids": [...]}'}),
+                }
+            job_ids = requested or job_ids
+        if job_ids:
+            return {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"jobs": get_jobs(job_ids)}),
+            }
+
+        job_id = params.get("job_id")
+        if not job_id:
+            return {
+                "statusCode": 400,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"error": "Missing 'job_id' parameter"}),
+            }
+        job = get_job(job_id)
+        if job is None:
+            return {
+                "statusCode": 404,
+                "headers": {"Access-Control-Allow-Origin": "*"},
+                "body": json.dumps({"error": f"No job with id {job_id}"}),
+            }
+        return {
+            "statusCode": 200,
+            "headers": {"Access-Control-Allow-Origin": "*"},
+            "body": json.dumps(job),
+        }
+    except Exception as e:
+        print("Error:", str(e))
+        return {
+            "statusCode": 500,
+            "headers": {"Access-Control-Allow-Origin": "*"},
+            "body": json.dumps({"error": str(e)}),
+        }
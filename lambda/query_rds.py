@@ -1,10 +1,13 @@
-import boto3
-
-# import os (removed as it is not accessed)
+import aws_clients
+import instrumentation
+import os
 import json
 import logging
+import time
 from botocore.exceptions import ClientError
 import psycopg2
+import psycopg2.errors
+from warm_cache import WarmCache
 
 # from psycopg2.errorcodes import UNIQUE_VIOLATION (removed as it is not accessed)
 # from psycopg2 import errors (removed as it is not accessed)
@@ -27,10 +30,7 @@ def get_ssm_parameter(
     :param with_decryption: Whether to decrypt the parameter (default is True)
     :return: The parameter value, or None if an error occurs
     """
-    ssm = boto3.client(
-        "ssm",
-        region_name=region_name,
-    )
+    ssm = aws_clients.get_client("ssm", region_name=region_name)
     logger.info(f"Attempting to retrieve parameter: {parameter_name}")
     try:
         response = ssm.get_parameter(
@@ -48,39 +48,171 @@ def get_ssm_parameter(
         return None
 
 
-client = boto3.client("rds-data")
-parameters_string = get_ssm_parameter(parameter_name="/rds/credentials")
+# Credentials are loaded on first connect, not at import, and re-read after
+# DB_CREDENTIALS_TTL seconds or when a connect fails
+CREDENTIALS_TTL = float(os.environ.get("DB_CREDENTIALS_TTL", "900"))
+credentials = None
+credentials_loaded_at = 0.0
 
-if parameters_string is None:
-    raise Exception("error getting SSM params")
-if parameters_string is not None:
-    credentials = json.loads(parameters_string)
+# Optional RDS Proxy / pgbouncer endpoint used instead of the instance host
+proxy_host = os.environ.get("DB_PROXY_HOST")
+HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_HEALTH_CHECK_INTERVAL", "30"))
 
-port = credentials.get("port", 5432)
-database = credentials.get("database", "postgres")
-host = credentials.get("host")
-user = credentials.get("user")
-password = credentials.get("password")
+# "python" nests the rows in the handler, "postgres" has the database build
+# the JSON document and passes its text through untouched
+DIRECTORY_ENGINE = os.environ.get("DIRECTORY_ENGINE", "python")
 
+# Same alias fallback and null/empty skips as the loop in get_all_data.
+# jsonb_object_agg keeps the last value for a repeated device alias, like
+# the dict assignment does.
+DIRECTORY_JSON_SQL = """
+select coalesce(jsonb_object_agg(client_alias, devices), '{}'::jsonb)::text
+from (
+    select
+        client_alias,
+        jsonb_object_agg(
+            coalesce(nullif(device_alias, ''), device_name),
+            jsonb_build_object(
+                'device_name', device_name,
+                'client_number', client_number
+            )
+        ) as devices
+    from device_information
+    where client_alias is not null
+        and client_alias <> ''
+        and device_name is not null
+        and device_name <> ''
+        and status in ('Active')
+    group by client_alias
+) as clients
+"""
 
-def get_all_data():
+# Warm-container cache of the directory JSON. Within DIRECTORY_CACHE_TTL
+# seconds it is served as-is; after that the version probe decides whether
+# the full query has to run again. An empty probe means TTL only. With
+# DIRECTORY_CACHE_STALE_TTL set, an expired copy is served while that check
+# runs in the background.
+DIRECTORY_CACHE_TTL = float(os.environ.get("DIRECTORY_CACHE_TTL", "60"))
+DIRECTORY_CACHE_STALE_TTL = float(os.environ.get("DIRECTORY_CACHE_STALE_TTL", "0"))
+DIRECTORY_VERSION_SQL = os.environ.get(
+    "DIRECTORY_VERSION_SQL",
+    "select count(*), max(updated_at) from device_information",
+)
+directory_cache = WarmCache(
+    maxsize=1, ttl=DIRECTORY_CACHE_TTL, stale_ttl=DIRECTORY_CACHE_STALE_TTL
+)
 
-    conn = psycopg2.connect(
-        host=host,  # Connect to the local forwarded port
-        port=port,
-        dbname=database,
-        user=user,
-        password=password,
-    )
-    cur = conn.cursor()
+# One connection per warm container, reused across invocations
+connection = None
+last_used = 0.0
+
+
+def get_credentials(refresh=False):
+    """
+    Return the database credentials, loading them from SSM when needed.
+
+    :param refresh: Reload even if the cached credentials have not expired
+    :return: The decoded credentials dict
+    """
+    global credentials, credentials_loaded_at
+    expired = time.monotonic() - credentials_loaded_at >= CREDENTIALS_TTL
+    if credentials is None or expired or refresh:
+        parameters_string = get_ssm_parameter(parameter_name="/rds/credentials")
+        if parameters_string is None:
+            raise Exception("error getting SSM params")
+        credentials = json.loads(parameters_string)
+        credentials_loaded_at = time.monotonic()
+    return credentials
+
+
+def connect(refresh_credentials=False):
+    creds = get_credentials(refresh=refresh_credentials)
+    with instrumentation.timed("postgres.connect"):
+        return psycopg2.connect(
+            host=proxy_host or creds.get("host"),  # Connect to the local forwarded port
+            port=creds.get("port", 5432),
+            dbname=creds.get("database", "postgres"),
+            user=creds.get("user"),
+            password=creds.get("password"),
+            connect_timeout=5,
+            keepalives=1,
+            keepalives_idle=30,
+        )
+
+
+def open_connection():
+    try:
+        conn = connect()
+    except psycopg2.OperationalError as e:
+        # The password may have been rotated since the container started
+        logger.warning(f"Connect failed, reloading credentials: {e}")
+        conn = connect(refresh_credentials=True)
+    conn.autocommit = True
+    return conn
+
+
+def is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - last_used < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur, instrumentation.timed("postgres.execute"):
+            cur.execute("select 1")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_connection():
+    """
+    Return the container's connection, reconnecting if it was dropped.
+
+    A connection used within the last DB_HEALTH_CHECK_INTERVAL seconds is
+    trusted as-is; an older one is checked with a 'select 1' first.
+    """
+    global connection, last_used
+    if connection is None or not is_healthy(connection):
+        close_connection()
+        connection = open_connection()
+    last_used = time.monotonic()
+    return connection
+
+
+def close_connection():
+    global connection
+    if connection is not None:
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+    connection = None
+
+
+def run_query(sql):
+    try:
+        with get_connection().cursor() as cur:
+            with instrumentation.timed("postgres.execute"):
+                cur.execute(sql)
+                return cur.fetchall()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        # The server dropped us between the health check and the query
+        logger.warning(f"Query failed on a stale connection, retrying: {e}")
+        close_connection()
+        with get_connection().cursor() as cur:
+            with instrumentation.timed("postgres.execute"):
+                cur.execute(sql)
+                return cur.fetchall()
+
+
+def get_all_data():
 
     # handles empty or whitespace-only strings
-    cur.execute(
+    rds_response = run_query(
         """select client_alias, device_alias, device_name, client_number from device_information where client_alias is not null and status in ('Active')"""
     )
     result = {}
 
-    rds_response = cur.fetchall()
     for row in rds_response:
         client_alias = row[0]
         device_alias = row[1]
@@ -101,20 +233,71 @@ def get_all_data():
             "device_name": device_name,
             "client_number": client_number,
         }
-    cur.close()
-    conn.close()
-    # ssh_process.terminate()
     return result
 
 
+def get_all_data_json():
+    """
+    Return the device directory as JSON text.
+
+    With DIRECTORY_ENGINE=postgres the nested document is built by the
+    database in one row, so there is no per-row loop or re-serialization.
+    """
+    if DIRECTORY_ENGINE == "postgres":
+        return run_query(DIRECTORY_JSON_SQL)[0][0]
+    return json.dumps(get_all_data())
+
+
+def directory_version():
+    global DIRECTORY_VERSION_SQL
+    if not DIRECTORY_VERSION_SQL:
+        return None
+    try:
+        # run_query already reconnects and retries once if the connection dropped
+        return tuple(str(value) for value in run_query(DIRECTORY_VERSION_SQL)[0])
+    except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn) as e:
+        # The probe can never work here; fall back to expiring on the TTL alone
+        logger.warning(f"Directory version probe disabled, using TTL only: {e}")
+        DIRECTORY_VERSION_SQL = None
+        return None
+    except psycopg2.Error as e:
+        # Transient: reload this time and keep probing on later requests
+        logger.warning(f"Directory version probe failed: {e}")
+        return None
+
+
+def get_directory():
+    """
+    Return the directory JSON and whether it came from the cache.
+
+    Returns:
+        tuple: (JSON text, "Hit" or "Miss").
+    """
+
+    def load():
+        return directory_version(), get_all_data_json()
+
+    def revalidate(cached):
+        version = directory_version()
+        if version is not None and version == cached[0]:
+            return cached
+        return version, get_all_data_json()
+
+    (_, body), outcome = directory_cache.fetch("directory", load, revalidate)
+    return body, "Miss" if outcome == "miss" else "Hit"
+
+
+@instrumentation.instrumented
 def handler(event, context):  # event and context are required by AWS Lambda
     # _ = event  # Explicitly ignore unused parameter
     # _ = context  # Explicitly ignore unused parameter
 
-    result = json.dumps(get_all_data())
+    result, cache_status = get_directory()
     return {
         "statusCode": 200,
         "headers": {
+            "X-Cache": cache_status,
+            "Access-Control-Expose-Headers": "X-Cache",
             "Access-Control-Allow-Origin": "*",  # Allow requests from any origin
             "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-Amz-User-Agent",
             "Access-Control-Allow-Methods": "OPTIONS,GET",
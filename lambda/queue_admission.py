@@ -0,0 +1,85 @@
+import math
+from collections import deque
+
+
+class DrainModel:
+    """
+    Rolling estimate of how fast a queue drains.
+
+    Each snapshot is the queue depth (visible + in flight) and the number
+    of messages this container sent since the previous snapshot. Between
+    two snapshots the queue drained at least ``previous + sent - current``
+    messages; other producers can only make the true figure higher, so the
+    estimate errs towards longer waits. Snapshots older than ``window``
+    seconds are dropped.
+    """
+
+    def __init__(self, window=900, max_snapshots=256):
+        self.window = window
+        self.snapshots = deque(maxlen=max_snapshots)
+        self.pending_sent = 0
+
+    def sent(self, count=1):
+        self.pending_sent += count
+
+    def record(self, now, depth):
+        self.snapshots.append((now, depth, self.pending_sent))
+        self.pending_sent = 0
+        while self.snapshots and now - self.snapshots[0][0] > self.window:
+            self.snapshots.popleft()
+
+    def rate(self):
+        """
+        Returns:
+            float: Messages drained per second, or None without enough history.
+        """
+        if len(self.snapshots) < 2:
+            return None
+        drained = 0
+        for (_, before, _), (_, after, sent) in zip(
+            self.snapshots, list(self.snapshots)[1:]
+        ):
+            drained += max(0, before + sent - after)
+        span = self.snapshots[-1][0] - self.snapshots[0][0]
+        if span <= 0 or drained == 0:
+            return None
+        return drained / span
+
+    def wait_seconds(self, depth):
+        """
+        Estimate how long a job joining the queue now waits to be picked up.
+
+        Returns:
+            int: Seconds, or None when the drain rate is unknown.
+        """
+        rate = self.rate()
+        if rate is None:
+            return None
+        return math.ceil(depth / rate)
+
+
+def admit(depth, max_depth, model, requested=1, default_retry=60):
+    """
+    Decide how many of ``requested`` jobs the queue can take.
+
+    Args:
+        depth (int): Current visible + in-flight messages.
+        max_depth (int): The configured limit, or 0 for no limit.
+        model (DrainModel): The queue's drain history.
+        requested (int): Jobs in this submission.
+        default_retry (int): Retry hint when the drain rate is unknown.
+
+    Returns:
+        tuple: (jobs admitted, estimated wait in seconds or None, retry
+        hint in seconds for the rest or None if all were admitted).
+    """
+    eta = model.wait_seconds(depth)
+    if not max_depth:
+        return requested, eta, None
+    admitted = max(0, min(requested, max_depth - depth))
+    if admitted == requested:
+        return admitted, eta, None
+    # Long enough for the queue to drain enough to fit the rejected jobs
+    excess = depth + requested - max_depth
+    retry = model.wait_seconds(excess)
+    return admitted, eta, max(1, retry) if retry is not None else default_retry
@@ -0,0 +1,16 @@
+def iter_objects(s3, bucket, prefix):
+    """
+    Yield every object under a prefix, one listing page at a time.
+
+    Args:
+        s3: A boto3 S3 client.
+        bucket (str): The bucket to list.
+        prefix (str): The prefix to list.
+
+    Yields:
+        dict: The list_objects_v2 entry for each object.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get("Contents", [])
+
@@ -0,0 +1,550 @@
+import aws_clients
+import instrumentation
+import os
+import json
+import base64
+import io
+from collections import namedtuple
+import itertools
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+from s3_listing import iter_objects
+from warm_cache import WarmCache
+
+s3 = aws_clients.client("s3")
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+CATALOG_PREFIX = os.environ.get("VIDEO_CATALOG_PREFIX", "catalog/")
+# A catalog older than this is not trusted, as a safety net should a
+# notification ever be missed: GETs serve a fresh listing instead and the
+# next notification rewrites it.
+CATALOG_MAX_AGE = float(os.environ.get("VIDEO_CATALOG_MAX_AGE", "86400"))
+PDF_PREFIX = "pdf_evidance/"
+
+
+def parse_video_key(key):
+    """
+    Split a video/ file name into client, device name and date.
+
+    Args:
+        key (str): The key with the 'video/' prefix removed.
+
+    Returns:
+        tuple: (client, deviceName, date).
+    """
+    parts = key.split("_")
+    client = parts[0]
+    if "unannotated.mp4" in parts:
+        devicename = "_".join(parts[1:-3])
+        date = parts[-3]
+    else:
+        devicename = "_".join(
+            parts[1:-2]
+        )  # everything between first and last two parts
+        date = parts[-2]
+    return client, devicename, date
+
+
+def parse_test_key(key):
+    """
+    Split a vis_test/ file name into client, device name and date.
+
+    Args:
+        key (str): The key with the 'vis_test/' prefix removed.
+
+    Returns:
+        tuple: (client, deviceName, date).
+    """
+    parts = key.split("_")
+    client = parts[0]
+    devicename = "_".join(parts[0:-2])
+    date = parts[-2]
+    return client, devicename, date
+
+
+PARSERS = {"video/": parse_video_key, "vis_test/": parse_test_key}
+# Catalogs whose videos are paired with a PDF in pdf_evidance/
+PAIRS_PDFS = {"vis_test/"}
+
+
+class VideoRecord(
+    namedtuple(
+        "VideoRecord", ["client", "device_name", "date", "name", "last_modified", "size"]
+    )
+):
+    """
+    One catalog entry. Tuple-backed, so it carries no per-instance dict and
+    serializes to the same JSON list the catalog object stores. The URL is
+    not kept; it is the key appended to a shared CloudFront prefix.
+    """
+
+    __slots__ = ()
+
+
+def parse_catalog(body):
+    catalog = json.loads(body)
+    catalog["videos"] = {
+        key: VideoRecord(*record) for key, record in catalog["videos"].items()
+    }
+    return catalog
+
+
+def catalog_key(prefix):
+    return f"{CATALOG_PREFIX}{prefix.rstrip('/')}.json"
+
+
+def make_record(prefix, key, last_modified, size):
+    """
+    Parse a video key once into a compact catalog record.
+
+    Returns:
+        VideoRecord: The parsed record, or None if the key is not a video.
+    """
+    if not key.lower().endswith(VIDEO_EXTENSIONS):
+        return None
+    client, devicename, date = PARSERS[prefix](key.replace(prefix, ""))
+    return VideoRecord(
+        client, devicename, date, os.path.basename(key), last_modified, size
+    )
+
+
+def pdf_stem(key):
+    key = key.replace(PDF_PREFIX, "")
+    if key.endswith(".pdf"):
+        return key[: -len(".pdf")]
+    return None
+
+
+def build_catalog(bucket, prefix):
+    """
+    Build a catalog from a full listing of the prefix.
+
+    Args:
+        bucket (str): The videos bucket.
+        prefix (str): 'video/' or 'vis_test/'.
+
+    Returns:
+        dict: The catalog.
+    """
+    # The PDF stems are listed on a worker thread while the videos stream in
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if prefix in PAIRS_PDFS:
+            pdfs = executor.submit(instrumentation.bind(list_pdf_stems), bucket)
+        videos = {}
+        for obj in iter_objects(s3, bucket, prefix):
+            record = make_record(
+                prefix, obj["Key"], str(obj["LastModified"]), obj["Size"]
+            )
+            if record:
+                videos[obj["Key"]] = record
+        catalog = {"built_at": time_now(), "videos": videos}
+        if prefix in PAIRS_PDFS:
+            catalog["pdfs"] = pdfs.result()
+    return catalog
+
+
+def list_pdf_stems(bucket):
+    stems = (pdf_stem(obj["Key"]) for obj in iter_objects(s3, bucket, PDF_PREFIX))
+    return sorted(stem for stem in stems if stem is not None)
+
+
+def time_now():
+    return datetime.now(timezone.utc).timestamp()
+
+
+def load_catalog(bucket, prefix):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=catalog_key(prefix))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return parse_catalog(response["Body"].read())
+
+
+def save_catalog(bucket, prefix, catalog):
+    s3.put_object(
+        Bucket=bucket,
+        Key=catalog_key(prefix),
+        Body=json.dumps(catalog, separators=(",", ":")),
+        ContentType="application/json",
+    )
+
+
+def get_catalog(bucket, prefix):
+    """
+    Read the catalog for a prefix, building it from a listing if it is
+    missing or older than VIDEO_CATALOG_MAX_AGE.
+
+    Only the notification handler calls this. It is the catalogs' single
+    writer, so its read-modify-write cannot race another save.
+    """
+    catalog = load_catalog(bucket, prefix)
+    if catalog is None or time_now() - catalog["built_at"] > CATALOG_MAX_AGE:
+        catalog = build_catalog(bucket, prefix)
+        save_catalog(bucket, prefix, catalog)
+    return catalog
+
+
+def video_entry(record, relative, url_prefix, pdf_url_prefix, pdfs):
+    entry = {
+        "client": record.client,
+        "deviceName": record.device_name,
+        "date": record.date,
+        "name": record.name,
+        "url": url_prefix + relative,
+        "last_modified": record.last_modified,
+        "size": record.size,
+    }
+    if pdfs is not None:
+        stem = relative.split(".")[0]
+        if stem in pdfs:
+            entry["pdf_url"] = f"{pdf_url_prefix}{stem}.pdf"
+        else:
+            entry["pdf_url"] = None
+    return entry
+
+
+def iter_videos(catalog, prefix, domain, keys=None):
+    """
+    Yield the video entries the GET handlers return, one dict at a time.
+
+    Without ``keys`` every video comes back in key order, the order a
+    listing returns them in.
+    """
+    pdfs = set(catalog["pdfs"]) if prefix in PAIRS_PDFS else None
+    url_prefix = f"https://{domain}/{prefix}"
+    pdf_url_prefix = f"https://{domain}/{PDF_PREFIX}"
+    if keys is None:
+        keys = sorted(catalog["videos"])
+    for key in keys:
+        relative = key.replace(prefix, "")
+        yield video_entry(
+            catalog["videos"][key], relative, url_prefix, pdf_url_prefix, pdfs
+        )
+
+
+def iter_json(entries, ndjson=False):
+    """
+    Encode entries one at a time.
+
+    The JSON array form is byte-for-byte what ``json.dumps`` of the whole
+    list produces; NDJSON puts one entry per line.
+    """
+    if ndjson:
+        for entry in entries:
+            yield json.dumps(entry)
+            yield "\n"
+        return
+    yield "["
+    for i, entry in enumerate(entries):
+        if i:
+            yield ", "
+        yield json.dumps(entry)
+    yield "]"
+
+
+def encode(chunks):
+    body = io.StringIO()
+    for chunk in chunks:
+        body.write(chunk)
+    return body.getvalue()
+
+
+class VideoIndex:
+    """
+    Catalog keys sorted by (client, deviceName, date, key).
+
+    A client, or client and device, selects one contiguous run of the
+    index, found by binary search; a date range inside a device narrows the
+    run the same way. Cursors are the sort tuple of the last entry served.
+    """
+
+    def __init__(self, catalog):
+        self.entries = sorted(
+            (record[0], record[1], record[2], key)
+            for key, record in catalog["videos"].items()
+        )
+
+    def bounds(self, client=None, device=None, start=None, end=None):
+        lo, hi = 0, len(self.entries)
+        if client is None:
+            return lo, hi
+        if device is None:
+            first, last = (client,), (client + "\x00",)
+        elif start is None and end is None:
+            first, last = (client, device), (client, device + "\x00")
+        else:
+            first = (client, device, start or "")
+            last = (client, device, (end or "\uffff") + "\x00")
+        return bisect_left(self.entries, first), bisect_left(self.entries, last)
+
+    def page(
+        self, client=None, device=None, start=None, end=None, after=None, limit=100
+    ):
+        """
+        Return one page of matching catalog keys.
+
+        Args:
+            client (str): Only this client.
+            device (str): Only this deviceName.
+            start (str): Earliest date, 'YYYY-MM-DD', inclusive.
+            end (str): Latest date, 'YYYY-MM-DD', inclusive.
+            after (tuple): The cursor of the previous page.
+            limit (int): The page size.
+
+        Returns:
+            tuple: (keys, cursor of the last key or None if this was the last page).
+        """
+        lo, hi = self.bounds(client, device, start, end)
+        if after is not None:
+            lo = max(lo, bisect_right(self.entries, tuple(after)))
+        keys = []
+        last = None
+        for position in range(lo, hi):
+            entry = self.entries[position]
+            # Filters the binary search could not apply
+            if device is not None and entry[1] != device:
+                continue
+            if start is not None and entry[2] < start:
+                continue
+            if end is not None and entry[2] > end:
+                continue
+            if len(keys) == limit:
+                return keys, last
+            keys.append(entry[3])
+            last = entry
+        return keys, None
+
+
+def encode_cursor(entry):
+    return base64.urlsafe_b64encode(json.dumps(entry).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Raises:
+        ValueError: If the cursor is not one encode_cursor produced.
+    """
+    try:
+        entry = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from None
+    if not (
+        isinstance(entry, list)
+        and len(entry) == 4
+        and all(isinstance(part, str) for part in entry)
+    ):
+        raise ValueError("Invalid cursor")
+    return entry
+
+
+def parse_page_size(value):
+    """
+    Raises:
+        ValueError: If the page size is not a whole number.
+    """
+    try:
+        page_size = int(value or 100)
+    except ValueError:
+        raise ValueError(f"Invalid page_size: {value}") from None
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+# Warm-container copies of each catalog and its index, revalidated against
+# the catalog object's ETag so an unchanged catalog is not downloaded again.
+# VIDEO_CATALOG_TTL skips even that conditional GET for a few seconds.
+indexed_catalogs = WarmCache(
+    maxsize=int(os.environ.get("VIDEO_CATALOG_CACHE_SIZE", "8")),
+    ttl=float(os.environ.get("VIDEO_CATALOG_TTL", "0")),
+)
+
+
+def load_indexed_catalog(bucket, prefix, cached=None):
+    """
+    Fetch a catalog and build its index, or keep ``cached`` if unchanged.
+
+    A missing or expired catalog is replaced by a listing for this
+    container only. Saving it here could overwrite a notification the
+    event handler saved meanwhile, so the GET path never writes.
+
+    Returns:
+        tuple: (etag, catalog, VideoIndex); ``cached`` itself on a 304. The
+        etag is None while the catalog object does not exist.
+    """
+    kwargs = {"IfNoneMatch": cached[0]} if cached and cached[0] else {}
+    etag = None
+    try:
+        response = s3.get_object(Bucket=bucket, Key=catalog_key(prefix), **kwargs)
+    except s3.exceptions.NoSuchKey:
+        response = None
+    except s3.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "304":
+            raise
+        response = None
+        etag = cached[0]
+    if response is not None:
+        catalog = parse_catalog(response["Body"].read())
+        etag = response["ETag"]
+        if time_now() - catalog["built_at"] <= CATALOG_MAX_AGE:
+            return etag, catalog, VideoIndex(catalog)
+    # Missing, expired or unchanged since the copy we already hold
+    if cached and cached[0] == etag and time_now() - cached[1]["built_at"] <= CATALOG_MAX_AGE:
+        return cached
+    catalog = build_catalog(bucket, prefix)
+    return etag, catalog, VideoIndex(catalog)
+
+
+def get_indexed_catalog(bucket, prefix):
+    _, catalog, index = indexed_catalogs.get_or_load(
+        (bucket, prefix),
+        lambda: load_indexed_catalog(bucket, prefix),
+        lambda cached: load_indexed_catalog(bucket, prefix, cached),
+    )
+    return catalog, index
+
+
+PAGE_PARAMS = ("client", "deviceName", "start_date", "end_date", "page_size", "cursor")
+MAX_PAGE_SIZE = int(os.environ.get("VIDEO_MAX_PAGE_SIZE", "1000"))
+
+
+def wants_page(params):
+    return any(params.get(name) for name in PAGE_PARAMS)
+
+
+def page_videos(catalog, index, prefix, domain, params, ndjson=False):
+    """
+    Encode one filtered page of videos for the GET handlers.
+
+    Args:
+        params (dict): The request's query parameters: client, deviceName,
+            start_date, end_date, page_size and cursor.
+        ndjson (bool): One entry per line instead of a JSON object.
+
+    Returns:
+        tuple: (body, next cursor or None on the last page). The JSON body is
+        {"videos": [...], "next_cursor": ...}.
+
+    Raises:
+        ValueError: For a malformed page_size or cursor.
+    """
+    page_size = parse_page_size(params.get("page_size"))
+    cursor = params.get("cursor")
+    keys, last = index.page(
+        client=params.get("client") or None,
+        device=params.get("deviceName") or None,
+        start=params.get("start_date") or None,
+        end=params.get("end_date") or None,
+        after=decode_cursor(cursor) if cursor else None,
+        limit=page_size,
+    )
+    next_cursor = encode_cursor(last) if last else None
+    entries = iter_videos(catalog, prefix, domain, keys)
+    if ndjson:
+        return encode(iter_json(entries, ndjson=True)), next_cursor
+    chunks = itertools.chain(
+        ['{"videos": '],
+        iter_json(entries),
+        [', "next_cursor": ', json.dumps(next_cursor), "}"],
+    )
+    return encode(chunks), next_cursor
+
+
+def respond(catalog, index, prefix, domain, params):
+    """
+    Build the GET handlers' response.
+
+    A bare request gets every video as a JSON list; filters or paging get
+    one page (see page_videos). format=ndjson switches either to one entry
+    per line, with the page cursor in the X-Next-Cursor header.
+    """
+    ndjson = params.get("format") == "ndjson"
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "Content-Type,device",
+        "Access-Control-Allow-Methods": "OPTIONS,GET,POST",
+    }
+    if wants_page(params):
+        try:
+            body, next_cursor = page_videos(
+                catalog, index or VideoIndex(catalog), prefix, domain, params, ndjson
+            )
+        except ValueError as e:
+            return {"statusCode": 400, "headers": headers, "body": json.dumps({"error": str(e)})}
+        if ndjson and next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
+    else:
+        body = encode(iter_json(iter_videos(catalog, prefix, domain), ndjson))
+    if ndjson:
+        headers["Content-Type"] = "application/x-ndjson"
+    return {"statusCode": 200, "headers": headers, "body": body}
+
+
+def apply_record(catalogs, bucket, event_name, key):
+    """
+    Apply one S3 notification to the catalogs it affects.
+
+    Args:
+        catalogs (dict): (bucket, prefix) to catalog, loaded on demand.
+        bucket (str): The bucket the notification came from.
+        event_name (str): e.g. 'ObjectCreated:Put' or 'ObjectRemoved:Delete'.
+        key (str): The decoded object key.
+    """
+
+    def catalog_for(prefix):
+        if (bucket, prefix) not in catalogs:
+            catalogs[(bucket, prefix)] = get_catalog(bucket, prefix)
+        return catalogs[(bucket, prefix)]
+
+    created = event_name.startswith("ObjectCreated")
+    if key.startswith(PDF_PREFIX):
+        stem = pdf_stem(key)
+        if stem is None:
+            return
+        for prefix in PAIRS_PDFS:
+            catalog = catalog_for(prefix)
+            pdfs = set(catalog["pdfs"])
+            if created:
+                pdfs.add(stem)
+            else:
+                pdfs.discard(stem)
+            catalog["pdfs"] = sorted(pdfs)
+        return
+
+    prefix = next((p for p in PARSERS if key.startswith(p)), None)
+    if prefix is None or not key.lower().endswith(VIDEO_EXTENSIONS):
+        return
+    catalog = catalog_for(prefix)
+    if created:
+        # The notification's eventTime is not the object's LastModified, so
+        # read it back to keep entries identical to a listing
+        try:
+            head = s3.head_object(Bucket=bucket, Key=key)
+        except s3.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "404":
+                return  # already deleted again; its removal event follows
+            raise
+        catalog["videos"][key] = make_record(
+            prefix, key, str(head["LastModified"]), head["ContentLength"]
+        )
+    else:
+        catalog["videos"].pop(key, None)
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """
+    Keep the video catalogs in step with S3 ObjectCreated/ObjectRemoved
+    notifications on video/, vis_test/ and pdf_evidance/.
+    """
+    records = event.get("Records", [])
+    catalogs = {}
+    for record in records:
+        bucket = record["s3"]["bucket"]["name"]
+        key = unquote_plus(record["s3"]["object"]["key"])
+        apply_record(catalogs, bucket, record["eventName"], key)
+    for (bucket, prefix), catalog in catalogs.items():
+        save_catalog(bucket, prefix, catalog)
+    print(f"Updated {len(catalogs)} catalogs from {len(records)} records")
+    return {"catalogs": sorted(prefix for _, prefix in catalogs)}
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+
+import instrumentation
+
+MISSING = object()
+
+
+class WarmCache:
+    """
+    In-process LRU cache with per-entry TTL, shared by warm invocations.
+
+    At most ``maxsize`` entries are kept; the least recently used one is
+    evicted first. An entry is fresh for ``ttl`` seconds (None: until it is
+    evicted or invalidated). Past that, ``fetch`` either calls
+    ``revalidate(old_value)`` to check it cheaply or reloads it.
+
+    With ``stale_ttl`` set, an entry up to ``stale_ttl`` seconds past its
+    TTL is returned straight away and refreshed on a background thread.
+    Lambda freezes the container between invocations, so that refresh may
+    finish during the next one; the caller never waits for it.
+
+    Concurrent misses for one key share a single load.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, stale_ttl=0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.refreshing = set()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "revalidated": 0,
+            "refreshes": 0,
+            "evictions": 0,
+            "load_errors": 0,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def age(self, entry):
+        return self.clock() - entry[1]
+
+    def is_fresh(self, entry):
+        return self.ttl is None or self.age(entry) < self.ttl
+
+    def get(self, key, default=None):
+        """
+        Return a fresh value, or ``default`` (counted as a miss).
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not self.is_fresh(entry):
+                self.stats["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key=MISSING):
+        with self.lock:
+            if key is MISSING:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    clear = invalidate
+
+    def fetch(self, key, loader, revalidate=None):
+        """
+        Return the cached value for ``key``, loading it when needed.
+
+        Args:
+            key: Any hashable key.
+            loader (callable): Takes no arguments and returns the value.
+            revalidate (callable): Takes the expired value and returns the
+                value to keep: the same object when it is still current,
+                otherwise a new one.
+
+        Returns:
+            tuple: (value, outcome), outcome being "hit", "stale",
+            "revalidated" or "miss".
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                if self.is_fresh(entry):
+                    self.stats["hits"] += 1
+                    return entry[0], "hit"
+                if (
+                    self.stale_ttl
+                    and self.ttl is not None
+                    and self.age(entry) < self.ttl + self.stale_ttl
+                ):
+                    self.stats["stale_hits"] += 1
+                    if key not in self.refreshing:
+                        self.refreshing.add(key)
+                        # Its calls count toward this invocation, or are
+                        # dropped if it finishes after this one returned
+                        threading.Thread(
+                            target=instrumentation.bind(self.refresh),
+                            args=(key, entry[0], loader, revalidate),
+                            daemon=True,
+                        ).start()
+                    return entry[0], "stale"
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another caller may have loaded it while we waited
+            with self.lock:
+                current = self.entries.get(key)
+                if current is not None and current is not entry and self.is_fresh(current):
+                    self.stats["hits"] += 1
+                    return current[0], "hit"
+            try:
+                return self.load(key, entry, loader, revalidate)
+            finally:
+                with self.lock:
+                    self.key_locks.pop(key, None)
+
+    def get_or_load(self, key, loader, revalidate=None):
+        return self.fetch(key, loader, revalidate)[0]
+
+    def load(self, key, entry, loader, revalidate, background=False):
+        try:
+            if entry is not None and revalidate is not None:
+                value = revalidate(entry[0])
+            else:
+                value = loader()
+        except Exception:
+            with self.lock:
+                self.stats["load_errors"] += 1
+            raise
+        if entry is not None and value is entry[0]:
+            outcome, counter = "revalidated", "revalidated"
+        else:
+            outcome, counter = "miss", "misses"
+        with self.lock:
+            self.stats["refreshes" if background else counter] += 1
+        self.put(key, value)
+        return value, outcome
+
+    def refresh(self, key, old_value, loader, revalidate):
+        try:
+            self.load(key, (old_value, None), loader, revalidate, background=True)
+        except Exception as e:
+            print(f"Background refresh of {key!r} failed: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
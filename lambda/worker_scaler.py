@@ -0,0 +1,224 @@
+import aws_clients
+import instrumentation
+import os
+import json
+import math
+import time
+from collections import namedtuple
+
+sqs = aws_clients.client("sqs")
+ec2 = aws_clients.client("ec2")
+ssm = aws_clients.client("ssm")
+
+QueueSample = namedtuple("QueueSample", ["visible", "in_flight"])
+
+
+class ScalingPolicy:
+    """
+    Decide how many workers should run for a queue backlog.
+
+    Scaling out targets ``backlog_per_worker`` messages per worker and
+    happens at most once per ``scale_out_cooldown`` seconds. Scaling in is
+    one worker at a time and only once the backlog has stayed at or below
+    ``scale_in_ratio`` of what the smaller pool could handle for
+    ``idle_timeout`` seconds, and ``scale_in_cooldown`` has passed since the
+    last change. The gap between the two thresholds stops the pool from
+    flapping around a steady backlog. Nothing is stopped while any message
+    is in flight, since the scaler cannot tell which worker holds it.
+    """
+
+    def __init__(
+        self,
+        backlog_per_worker=5,
+        min_workers=0,
+        max_workers=1,
+        scale_out_cooldown=60,
+        scale_in_cooldown=300,
+        idle_timeout=900,
+        scale_in_ratio=0.5,
+    ):
+        self.backlog_per_worker = backlog_per_worker
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.scale_out_cooldown = scale_out_cooldown
+        self.scale_in_cooldown = scale_in_cooldown
+        self.idle_timeout = idle_timeout
+        self.scale_in_ratio = scale_in_ratio
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        return cls(
+            backlog_per_worker=float(environ.get("SCALER_BACKLOG_PER_WORKER", "5")),
+            min_workers=int(environ.get("SCALER_MIN_WORKERS", "0")),
+            max_workers=int(environ.get("SCALER_MAX_WORKERS", "1")),
+            scale_out_cooldown=float(environ.get("SCALER_SCALE_OUT_COOLDOWN", "60")),
+            scale_in_cooldown=float(environ.get("SCALER_SCALE_IN_COOLDOWN", "300")),
+            idle_timeout=float(environ.get("SCALER_IDLE_TIMEOUT", "900")),
+            scale_in_ratio=float(environ.get("SCALER_SCALE_IN_RATIO", "0.5")),
+        )
+
+    def clamp(self, workers):
+        return max(self.min_workers, min(self.max_workers, workers))
+
+    def decide(self, state, samples, active, now):
+        """
+        Work out the worker count for one scaling tick.
+
+        Args:
+            state (dict): 'last_scale_out', 'last_scale_in' and 'low_since'
+                from the previous tick; updated in place.
+            samples (list): One QueueSample per queue.
+            active (int): Workers running or starting.
+            now (float): The current time in seconds.
+
+        Returns:
+            int: The number of workers that should be active.
+        """
+        backlog = sum(s.visible + s.in_flight for s in samples)
+        wanted = self.clamp(math.ceil(backlog / self.backlog_per_worker))
+
+        if wanted > active:
+            state["low_since"] = None
+            if now - state.get("last_scale_out", -math.inf) < self.scale_out_cooldown:
+                return active
+            state["last_scale_out"] = now
+            return wanted
+
+        smaller = self.clamp(active - 1)
+        if smaller == active:
+            state["low_since"] = None
+            return active
+        low = backlog <= smaller * self.backlog_per_worker * self.scale_in_ratio
+        if not low:
+            state["low_since"] = None
+            return active
+        if state.get("low_since") is None:
+            state["low_since"] = now
+        if now - state["low_since"] < self.idle_timeout:
+            return active
+        last_change = max(
+            state.get("last_scale_in", -math.inf),
+            state.get("last_scale_out", -math.inf),
+        )
+        if now - last_change < self.scale_in_cooldown:
+            return active
+        if any(s.in_flight for s in samples):
+            # Wait for the in-flight jobs to finish; the backlog stays low
+            return active
+        state["last_scale_in"] = now
+        # Each further step down needs the backlog to stay low again
+        state["low_since"] = now
+        return smaller
+
+
+def queue_samples(queue_urls):
+    samples = []
+    for queue_url in queue_urls:
+        attributes = sqs.get_queue_attributes(
+            QueueUrl=queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+            ],
+        )["Attributes"]
+        samples.append(
+            QueueSample(
+                int(attributes["ApproximateNumberOfMessages"]),
+                int(attributes["ApproximateNumberOfMessagesNotVisible"]),
+            )
+        )
+    return samples
+
+
+def instance_states(instance_ids):
+    states = {}
+    response = ec2.describe_instances(InstanceIds=instance_ids)
+    for reservation in response["Reservations"]:
+        for instance in reservation["Instances"]:
+            states[instance["InstanceId"]] = instance["State"]["Name"]
+    return states
+
+
+def load_state(parameter_name):
+    try:
+        response = ssm.get_parameter(Name=parameter_name)
+    except ssm.exceptions.ParameterNotFound:
+        return {}
+    return json.loads(response["Parameter"]["Value"])
+
+
+def save_state(parameter_name, state):
+    ssm.put_parameter(
+        Name=parameter_name, Value=json.dumps(state), Type="String", Overwrite=True
+    )
+
+
+def scaler_queue_urls(environ=os.environ):
+    """
+    The queues whose backlog the EC2 pool works through.
+
+    Only the FIFO queue by default: QUEUE_URL_2 carries Analysis Data jobs
+    that another consumer handles, so counting it would start workers for
+    traffic they never pick up and keep them running while it is busy.
+
+    Returns:
+        list: Queue URLs from SCALER_QUEUE_URLS (comma-separated), or
+        QUEUE_URL when that is unset.
+    """
+    urls = environ.get("SCALER_QUEUE_URLS", environ.get("QUEUE_URL", ""))
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """
+    Scheduled scaler: start or stop pool instances to follow the backlog.
+    """
+    queue_urls = scaler_queue_urls()
+    instance_ids = [
+        i.strip()
+        for i in os.environ.get(
+            "WORKER_INSTANCE_IDS", os.environ.get("INSTANCE_ID", "")
+        ).split(",")
+        if i.strip()
+    ]
+    if not instance_ids:
+        # describe_instances with no ids would return every instance in the
+        # account, and the scaler must only touch its own pool
+        print("No WORKER_INSTANCE_IDS or INSTANCE_ID configured; nothing to scale.")
+        return {"backlog": [], "active": 0, "target": 0, "started": [], "stopped": []}
+    parameter_name = os.environ.get("SCALER_STATE_PARAMETER", "/worker-scaler/state")
+    policy = ScalingPolicy.from_environ()
+    policy.max_workers = min(policy.max_workers, len(instance_ids))
+
+    samples = queue_samples(queue_urls)
+    states = instance_states(instance_ids)
+    active = [i for i in instance_ids if states.get(i) in ("pending", "running")]
+    stopped = [i for i in instance_ids if states.get(i) == "stopped"]
+
+    state = load_state(parameter_name)
+    before = dict(state)
+    target = policy.decide(state, samples, len(active), time.time())
+
+    started, stopping = [], []
+    if target > len(active):
+        started = stopped[: target - len(active)]
+        if started:
+            ec2.start_instances(InstanceIds=started)
+    elif target < len(active):
+        # Stop the most recently listed workers first, keeping the pool's
+        # first instances as the long-lived ones
+        stopping = active[target - len(active) :]
+        ec2.stop_instances(InstanceIds=stopping)
+    if state != before:
+        save_state(parameter_name, state)
+
+    result = {
+        "backlog": [s._asdict() for s in samples],
+        "active": len(active),
+        "target": target,
+        "started": started,
+        "stopped": stopping,
+    }
+    print(json.dumps(result))
+    return result
@@ -0,0 +1,183 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import available_dates
+from folder_sizer import FolderSize, folder_size
+
+DEVICE = "client1_device_01"
+ROOT = f"client1-raw-data/{DEVICE}/"
+BIG = 30 * 1024 * 1024
+# Mid-year, so days seeded a few days back never fall in the previous year
+NOW = datetime(2024, 6, 15, 12)
+
+
+class FakeS3:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, folder_sizes):
+        self.folder_sizes = folder_sizes
+        self.objects = {}
+        self.calls = 0
+
+    def get_object(self, Bucket, Key):
+        self.calls += 1
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls += 1
+        self.objects[Key] = Body.encode()
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, **kwargs):
+        self.calls += 1
+        if Delimiter:
+            return {
+                "CommonPrefixes": [{"Prefix": f"{ROOT}{d}/"} for d in self.folder_sizes]
+                + [{"Prefix": f"{ROOT}not-a-date/"}]
+            }
+        date = Prefix[len(ROOT) :].split("/")[0]
+        if date not in self.folder_sizes:
+            return {}
+        return {"Contents": [{"Size": self.folder_sizes[date]}]}
+
+    def get_paginator(self, operation_name):
+        fake = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield fake.list_objects_v2(**kwargs)
+
+        return Paginator()
+
+
+def days_ago(n, now=None):
+    return ((now or datetime.now()) - timedelta(days=n)).strftime("%Y-%m-%d")
+
+
+@pytest.fixture
+def fake_s3(monkeypatch):
+    def install(folder_sizes):
+        fake = FakeS3(folder_sizes)
+        monkeypatch.setattr(available_dates, "s3", fake)
+        available_dates.clear_caches()
+        return fake
+
+    return install
+
+
+def test_discover_matches_walk(fake_s3):
+    this_year = datetime.now().timetuple().tm_yday
+    sizes = {days_ago(i): BIG if i % 2 else 100 for i in range(0, this_year, 3)}
+
+    fake_s3(sizes)
+    walked = sorted(available_dates.walk_dates(DEVICE), reverse=True)[:10]
+    fake = fake_s3(sizes)
+    found = sorted(available_dates.discover_dates(DEVICE), reverse=True)[:10]
+
+    assert found == walked
+    assert fake.calls <= len(sizes) + 1
+
+
+def test_discover_skips_small_folders_and_shifts_a_day(fake_s3):
+    today = datetime.now()
+    fake_s3({days_ago(0): BIG, days_ago(1): 100})
+
+    result = available_dates.discover_dates(DEVICE)
+
+    assert result == [(today + timedelta(days=1)).strftime("%Y-%m-%d")]
+
+
+class PagedS3:
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = 0
+
+    def get_paginator(self, operation_name):
+        fake = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                for page in fake.pages:
+                    fake.fetched += 1
+                    yield page
+
+        return Paginator()
+
+
+def test_folder_size_reads_past_first_page():
+    pages = [{"Contents": [{"Size": 10}] * 1000}, {"Contents": [{"Size": 10}] * 5}]
+
+    size = folder_size(PagedS3(pages), "bucket", "prefix/")
+
+    assert size == FolderSize(10050, 2, 1005, False)
+
+
+def test_folder_size_stops_once_threshold_crossed():
+    pages = [{"Contents": [{"Size": BIG}]}, {"Contents": [{"Size": BIG}]}]
+    s3 = PagedS3(pages)
+
+    size = folder_size(s3, "bucket", "prefix/", threshold=20 * 1024 * 1024)
+
+    assert size.exceeded and size.pages == 1
+    assert s3.fetched == 1
+
+
+def test_get_dates_serves_repeat_lookups_from_cache(fake_s3):
+    fake = fake_s3({days_ago(0): BIG, days_ago(3): BIG})
+
+    first = available_dates.get_dates(DEVICE)
+    calls = fake.calls
+    second = available_dates.get_dates(DEVICE)
+
+    assert first == second
+    assert first == sorted(first, reverse=True)
+    assert fake.calls == calls
+
+
+def test_index_only_sizes_days_after_last_indexed(fake_s3):
+    def ago(n):
+        return days_ago(n, NOW)
+
+    fake = fake_s3({ago(1): BIG, ago(2): BIG, ago(5): BIG})
+    available_dates.get_dates(DEVICE, now=NOW)
+    index_key = f"date-index/{DEVICE}.json"
+    index = json.loads(fake.objects[index_key])
+    assert index["last_indexed"] == ago(1)
+
+    # Pretend the index was written two days ago; a cold container should
+    # read it and size only the two missing days.
+    del index["days"][ago(1)]
+    index["last_indexed"] = ago(3)
+    fake.objects[index_key] = json.dumps(index).encode()
+    available_dates.clear_caches()
+    stats = available_dates.new_stats()
+
+    dates = available_dates.get_dates(DEVICE, stats=stats, now=NOW)
+
+    assert stats["folders"] == 3  # yesterday, the day before, and today
+    assert dates == [ago(0), ago(1), ago(4)]
+    assert json.loads(fake.objects[index_key])["last_indexed"] == ago(1)
+
+
+def test_stale_index_only_sizes_folders_that_exist(fake_s3):
+    fake = fake_s3({days_ago(1, NOW): BIG, days_ago(100, NOW): BIG})
+    index_key = f"date-index/{DEVICE}.json"
+    fake.objects[index_key] = json.dumps(
+        {
+            "threshold": available_dates.SIZE_THRESHOLD,
+            "last_indexed": "2024-01-01",
+            "days": {},
+        }
+    ).encode()
+    stats = available_dates.new_stats()
+
+    dates = available_dates.get_dates(DEVICE, stats=stats, now=NOW)
+
+    assert stats["folders"] == 3  # the two folders, and today
+    assert dates == [days_ago(0, NOW), days_ago(99, NOW)]
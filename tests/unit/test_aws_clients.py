@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+import boto3
+import pytest
+
+import aws_clients
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "lambda")
+
+HANDLER_MODULES = [
+    "available_dates",
+    "check_models",
+    "check_queue",
+    "dynamodb_fn",
+    "inventory_volumes",
+    "job_status",
+    "query_rds",
+    "s3_full_test",
+    "s3_match",
+    "video_catalog",
+    "worker_scaler",
+]
+
+
+@pytest.fixture
+def built(monkeypatch):
+    calls = []
+    real_client, real_resource = boto3.client, boto3.resource
+    monkeypatch.setattr(boto3, "client", lambda *a, **kw: calls.append(a) or real_client(*a, **kw))
+    monkeypatch.setattr(
+        boto3, "resource", lambda *a, **kw: calls.append(a) or real_resource(*a, **kw)
+    )
+    aws_clients.reset()
+    yield calls
+    aws_clients.reset()
+
+
+# Imports the handler in a fresh interpreter, as Lambda's INIT does, so
+# module globals set up under this environment never leak into other tests
+COUNT_CLIENTS_AT_IMPORT = """
+import sys
+import boto3
+
+built = []
+real_client, real_resource = boto3.client, boto3.resource
+boto3.client = lambda *a, **kw: built.append(a) or real_client(*a, **kw)
+boto3.resource = lambda *a, **kw: built.append(a) or real_resource(*a, **kw)
+sys.path.insert(0, sys.argv[1])
+__import__(sys.argv[2])
+print(len(built))
+"""
+
+
+@pytest.mark.parametrize("name", HANDLER_MODULES)
+def test_importing_a_handler_creates_no_clients(name):
+    env = dict(
+        os.environ,
+        QUEUE_URL="https://sqs.us-east-1.amazonaws.com/1/q.fifo",
+        QUEUE_URL_2="https://sqs.us-east-1.amazonaws.com/1/q2",
+        INSTANCE_ID="i-123",
+        JOB_STATUS_TABLE="JobStatus",
+    )
+
+    output = subprocess.check_output(
+        [sys.executable, "-c", COUNT_CLIENTS_AT_IMPORT, LAMBDA_DIR, name], env=env
+    )
+
+    assert output.decode().split()[-1] == "0"
+
+
+def test_clients_are_built_on_first_use_and_shared(built):
+    first, second = aws_clients.client("s3"), aws_clients.client("s3")
+    assert built == []
+
+    assert first.meta.service_model.service_name == "s3"
+    assert second.meta is first.meta
+    assert built == [("s3",)]
+
+    assert aws_clients.get_client("s3", region_name="eu-west-1") is not first._target
+    assert len(built) == 2
+
+
+def test_eager_mode_builds_clients_at_declaration(built, monkeypatch):
+    monkeypatch.setattr(aws_clients, "EAGER", True)
+
+    aws_clients.client("sqs")
+
+    assert built == [("sqs",)]
@@ -0,0 +1,126 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import check_models
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        monkeypatch.setattr(check_models, "s3", client)
+        client.create_bucket(Bucket="graph-pilot")
+        client.create_bucket(Bucket="vendor-analysis-webapp-production")
+        for key in ("models/a.pt", "models/b.onnx", "models/readme.txt"):
+            client.put_object(Bucket="graph-pilot", Key=key, Body=b"")
+        client.put_object(Bucket="graph-pilot", Key="models/VERSION", Body=b"1")
+        yield client
+
+
+def event(**params):
+    params = {"device_name": "c_d_7", "ClientNumber": "3", "Date": "2025-03-01", **params}
+    return {"queryStringParameters": params}
+
+
+def test_catalog_relists_only_when_marker_changes(s3, monkeypatch):
+    catalog = check_models.ModelCatalog(ttl=0, marker_key="models/VERSION")
+    listed = []
+    real_list = check_models.list_models
+    monkeypatch.setattr(
+        check_models, "list_models", lambda *a: listed.append(a) or real_list(*a)
+    )
+
+    assert catalog.get("graph-pilot", "models/") == ["a.pt", "b.onnx"]
+    assert catalog.get("graph-pilot", "models/") == ["a.pt", "b.onnx"]
+    assert len(listed) == 1
+
+    s3.put_object(Bucket="graph-pilot", Key="models/c.h5", Body=b"")
+    s3.put_object(Bucket="graph-pilot", Key="models/VERSION", Body=b"2")
+
+    assert catalog.get("graph-pilot", "models/") == ["a.pt", "b.onnx", "c.h5"]
+    assert len(listed) == 2
+
+
+def test_handler_options(s3, monkeypatch):
+    monkeypatch.setattr(check_models, "model_catalog", check_models.ModelCatalog(ttl=60))
+    s3.put_object(
+        Bucket="vendor-analysis-webapp-production",
+        Key="output/client-3/client-3_device-os7_date-2025-03-01_disposal.csv",
+        Body=b"",
+    )
+
+    body = json.loads(check_models.handler(event(), None)["body"])
+
+    assert body["options"] == ["Logs", "a.pt", "b.onnx", "Analysis Data"]
+    assert body["csv"][0] is True
+
+
+def test_batch_lists_models_once_and_keys_by_pair(s3, monkeypatch):
+    catalog = check_models.ModelCatalog(ttl=60)
+    monkeypatch.setattr(check_models, "model_catalog", catalog)
+    s3.put_object(
+        Bucket="vendor-analysis-webapp-production",
+        Key="output/client-3/client-3_device-os7_date-2025-03-01_disposal.csv",
+        Body=b"",
+    )
+    pairs = [
+        {"device_name": "c_d_7", "Date": "2025-03-01"},
+        {"device_name": "c_d_7", "Date": "2025-03-02"},
+        {"device_name": "c_d_8", "Date": "2025-03-01", "ClientNumber": "4"},
+        {"device_name": "c_d_9"},
+    ]
+
+    response = check_models.handler(
+        {"queryStringParameters": None, "body": json.dumps({"ClientNumber": "3", "pairs": pairs})},
+        None,
+    )
+    results = json.loads(response["body"])["results"]
+
+    assert results["3/c_d_7/2025-03-01"]["options"][-1] == "Analysis Data"
+    assert results["3/c_d_7/2025-03-02"]["csv"] == [
+        False,
+        "output/client-3/client-3_device-os7_date-2025-03-02_disposal.csv",
+    ]
+    assert results["4/c_d_8/2025-03-01"]["csv"][1].startswith("output/client-4/")
+    assert "error" in results["pairs[3]"]
+
+
+def test_batch_keeps_client_numbers_apart_and_reports_errors_per_pair(s3, monkeypatch):
+    monkeypatch.setattr(check_models, "model_catalog", check_models.ModelCatalog(ttl=60))
+    real_head = s3.head_object
+
+    def head_object(Bucket, Key):
+        if "client-5/" in Key:
+            raise s3.exceptions.ClientError(
+                {"Error": {"Code": "403", "Message": "Forbidden"}}, "HeadObject"
+            )
+        return real_head(Bucket=Bucket, Key=Key)
+
+    monkeypatch.setattr(s3, "head_object", head_object)
+    pairs = [
+        {"device_name": "c_d_7", "Date": "2025-03-01", "ClientNumber": "3"},
+        {"device_name": "c_d_7", "Date": "2025-03-01", "ClientNumber": "4"},
+        {"device_name": "c_d_7", "Date": "2025-03-01", "ClientNumber": "5"},
+        "c_d_7/2025-03-01",
+    ]
+
+    response = check_models.handler({"body": json.dumps({"pairs": pairs})}, None)
+    results = json.loads(response["body"])["results"]
+
+    assert response["statusCode"] == 200
+    assert results["3/c_d_7/2025-03-01"]["csv"][1].startswith("output/client-3/")
+    assert results["4/c_d_7/2025-03-01"]["csv"][1].startswith("output/client-4/")
+    assert "403" in results["5/c_d_7/2025-03-01"]["error"]
+    assert "error" in results["pairs[3]"]
+
+
+def test_batch_size_is_capped(s3, monkeypatch):
+    monkeypatch.setattr(check_models, "MAX_BATCH_PAIRS", 2)
+    pairs = [{"device_name": "c_d_7", "Date": "2025-03-01"}] * 3
+
+    response = check_models.handler({"body": json.dumps({"pairs": pairs})}, None)
+
+    assert response["statusCode"] == 400
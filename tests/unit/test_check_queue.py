@@ -0,0 +1,272 @@
+import importlib
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    with mock_aws():
+        sqs = boto3.client("sqs", region_name="us-east-1")
+        ec2 = boto3.client("ec2", region_name="us-east-1")
+        fifo = sqs.create_queue(
+            QueueName="jobs.fifo",
+            Attributes={"FifoQueue": "true", "ContentBasedDeduplication": "true"},
+        )["QueueUrl"]
+        standard = sqs.create_queue(QueueName="analysis")["QueueUrl"]
+        instance = ec2.run_instances(ImageId="ami-12345678", MinCount=1, MaxCount=1)
+        instance_id = instance["Instances"][0]["InstanceId"]
+        ec2.stop_instances(InstanceIds=[instance_id])
+        monkeypatch.setenv("QUEUE_URL", fifo)
+        monkeypatch.setenv("QUEUE_URL_2", standard)
+        monkeypatch.setenv("INSTANCE_ID", instance_id)
+        import check_queue
+
+        module = importlib.reload(check_queue)
+        yield module, sqs, ec2
+
+
+def submit(check_queue, **params):
+    params = {"Device": "acme_cam_1", "Date": "2025-03-01", **params}
+    response = check_queue.handler({"queryStringParameters": params}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def count_calls(monkeypatch, client, name):
+    calls = []
+    real = getattr(client, name)
+    monkeypatch.setattr(client, name, lambda **kw: calls.append(kw) or real(**kw))
+    return calls
+
+
+def test_submission_starts_a_stopped_instance_and_reports_the_queue(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    describes = count_calls(monkeypatch, check_queue.ec2, "describe_instances")
+
+    status, body = submit(check_queue)
+    assert status == 200
+    assert body["ec2_status"] == "EC2 instance starting."
+    assert set(body) == {
+        "message",
+        "ec2_status",
+        "ApproximateNumberOfMessages (Visible)",
+        "ApproximateNumberOfMessagesNotVisible (In-Flight)",
+        "estimated_wait_seconds",
+        "Form",
+    }
+
+    # The start invalidated the cached state; the next lookup is cached again
+    submit(check_queue)
+    submit(check_queue)
+    assert len(describes) == 2
+
+
+def fail_ec2(monkeypatch, check_queue):
+    def unavailable(**kwargs):
+        raise check_queue.ec2.exceptions.ClientError(
+            {"Error": {"Code": "RequestLimitExceeded", "Message": "Slow down"}},
+            "DescribeInstances",
+        )
+
+    monkeypatch.setattr(check_queue.ec2, "describe_instances", unavailable)
+
+
+def test_ec2_errors_do_not_fail_a_queued_job(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    fail_ec2(monkeypatch, check_queue)
+
+    status, body = submit(check_queue)
+
+    assert status == 200
+    assert body["ec2_status"].startswith("EC2 check failed")
+    messages = sqs.receive_message(QueueUrl=check_queue.QUEUE_URL)["Messages"]
+    assert len(messages) == 1
+
+
+def test_ec2_errors_do_not_fail_a_queued_bulk_request(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    fail_ec2(monkeypatch, check_queue)
+    body = {"jobs": [{"Device": "acme_cam_1"}, {"Device": "acme_cam_2"}]}
+
+    response = check_queue.handler({"body": json.dumps(body)}, None)
+    result = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert result["ec2_status"].startswith("EC2 check failed")
+    assert [job["status"] for job in result["jobs"]] == ["queued", "queued"]
+
+
+def test_analysis_jobs_skip_ec2(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    describes = count_calls(monkeypatch, check_queue.ec2, "describe_instances")
+
+    status, body = submit(check_queue, selected_models="Analysis Data")
+
+    assert (status, body["ec2_status"]) == (200, "Not needed")
+    assert describes == []
+
+
+def test_bulk_sends_in_batches_of_ten_and_reports_each_job(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    describes = count_calls(monkeypatch, check_queue.ec2, "describe_instances")
+    batches = count_calls(monkeypatch, check_queue.sqs, "send_message_batch")
+    jobs = [{"Device": f"acme_cam_{i}"} for i in range(12)]
+    jobs.append({"Device": "acme_cam_1", "selected_models": "Analysis Data"})
+    jobs.append({"Device": ""})
+
+    response = check_queue.handler(
+        {
+            "queryStringParameters": {"Date": "2025-03-01"},
+            "body": json.dumps({"Form": {"FPS": 5}, "jobs": jobs}),
+        },
+        None,
+    )
+    body = json.loads(response["body"])
+
+    assert [job["status"] for job in body["jobs"]] == ["queued"] * 13 + ["failed"]
+    assert body["ec2_status"] == "EC2 instance starting."
+    assert sorted(len(call["Entries"]) for call in batches) == [1, 2, 10]
+    assert len(describes) == 1
+    message = json.loads(batches[0]["Entries"][0]["MessageBody"])
+    assert (message["FPS"], message["Date"]) == (5.0, "2025-03-01")
+
+
+def test_fifo_messages_are_grouped_by_device_and_deduplicated_by_content(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    sends = count_calls(monkeypatch, check_queue.sqs, "send_message")
+
+    submit(check_queue, Device="acme_cam_1", End_Time="10")
+    submit(check_queue, Device="acme_cam_1", End_Time="10")
+    submit(check_queue, Device="acme_cam_2", End_Time="10")
+
+    assert [s["MessageGroupId"] for s in sends] == ["acme_cam_1", "acme_cam_1", "acme_cam_2"]
+    assert sends[0]["MessageDeduplicationId"] == sends[1]["MessageDeduplicationId"]
+    assert sends[0]["MessageDeduplicationId"] != sends[2]["MessageDeduplicationId"]
+
+
+def test_dedup_ignores_the_random_end_time_default(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    sends = count_calls(monkeypatch, check_queue.sqs, "send_message")
+
+    submit(check_queue, selected_models="b,a")
+    submit(check_queue, selected_models="a,b")
+
+    bodies = [json.loads(s["MessageBody"]) for s in sends]
+    assert bodies[0]["End Time"] != bodies[1]["End Time"]
+    assert sends[0]["MessageDeduplicationId"] == sends[1]["MessageDeduplicationId"]
+
+
+def test_device_names_sqs_rejects_are_hashed_into_a_stable_group(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    sends = count_calls(monkeypatch, check_queue.sqs, "send_message")
+
+    for device in ("acme_cam 1", "acme_cam 1", "acme_" + "x" * 200):
+        assert submit(check_queue, Device=device)[0] == 200
+
+    groups = [s["MessageGroupId"] for s in sends]
+    assert groups[0] == groups[1] != groups[2]
+    assert all(check_queue.VALID_GROUP_ID.fullmatch(g) for g in groups)
+
+
+def test_bucket_strategy_is_stable_and_bounded(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    monkeypatch.setattr(check_queue, "MESSAGE_GROUP_STRATEGY", "bucket")
+    monkeypatch.setattr(check_queue, "MESSAGE_GROUP_BUCKETS", 4)
+
+    groups = {check_queue.message_group_id({"Device": f"acme_cam_{i}"}) for i in range(50)}
+
+    assert groups <= {f"bucket-{i}" for i in range(4)}
+    assert check_queue.message_group_id({"Device": "x"}) == check_queue.message_group_id(
+        {"Device": "x"}
+    )
+
+
+def test_full_queue_returns_429_with_a_retry_hint(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    monkeypatch.setitem(check_queue.MAX_QUEUE_DEPTH, check_queue.QUEUE_URL_2, 2)
+    model = check_queue.drain_models[check_queue.QUEUE_URL_2]
+    # Simulated history: the queue drained 6 messages in the last minute
+    model.record(0, 6)
+    model.record(60, 0)
+    monkeypatch.setattr(check_queue.time, "time", lambda: 60)
+
+    assert submit(check_queue, selected_models="Analysis Data")[1]["estimated_wait_seconds"] == 0
+    submit(check_queue, selected_models="Analysis Data")
+    response = check_queue.handler(
+        {"queryStringParameters": {"Device": "acme_cam_1", "selected_models": "Analysis Data"}},
+        None,
+    )
+
+    assert response["statusCode"] == 429
+    assert response["headers"]["Retry-After"] == "10"
+    assert json.loads(response["body"])["retry_after"] == 10
+
+
+def test_refused_submissions_do_not_start_the_worker(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    monkeypatch.setitem(check_queue.MAX_QUEUE_DEPTH, check_queue.QUEUE_URL, 1)
+    sqs.send_message(
+        QueueUrl=check_queue.QUEUE_URL, MessageBody="{}", MessageGroupId="g"
+    )
+    describes = count_calls(monkeypatch, check_queue.ec2, "describe_instances")
+    starts = count_calls(monkeypatch, check_queue.ec2, "start_instances")
+
+    assert submit(check_queue)[0] == 429
+    bulk = check_queue.handler({"body": json.dumps({"jobs": [{"Device": "acme_cam_1"}]})}, None)
+    assert bulk["statusCode"] == 429
+    assert json.loads(bulk["body"])["ec2_status"] == "Not needed"
+    assert describes == starts == []
+
+
+def test_bulk_admits_up_to_the_limit(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    monkeypatch.setitem(check_queue.MAX_QUEUE_DEPTH, check_queue.QUEUE_URL, 3)
+    jobs = [{"Device": f"acme_cam_{i}"} for i in range(5)]
+
+    response = check_queue.handler(
+        {"queryStringParameters": {}, "body": json.dumps({"jobs": jobs})}, None
+    )
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert [job["status"] for job in body["jobs"]] == ["queued"] * 3 + ["rejected"] * 2
+    assert body["jobs"][3]["retry_after"] == check_queue.DEFAULT_RETRY_AFTER
+
+    response = check_queue.handler(
+        {"queryStringParameters": {}, "body": json.dumps({"jobs": jobs[:1]})}, None
+    )
+    assert response["statusCode"] == 429
+
+
+def test_tracked_jobs_get_an_id_and_are_not_resubmitted(aws, monkeypatch):
+    check_queue, sqs, ec2 = aws
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = dynamodb.create_table(
+        TableName="JobStatus",
+        KeySchema=[{"AttributeName": "JobId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "JobId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    monkeypatch.setattr(check_queue.job_status, "table", table)
+    monkeypatch.setattr(check_queue.job_status, "JOB_STATUS_TABLE", "JobStatus")
+    sends = count_calls(monkeypatch, check_queue.sqs, "send_message")
+
+    status, first = submit(check_queue, End_Time="10")
+    status, again = submit(check_queue, End_Time="10")
+
+    assert again["message"] == "Job already queued."
+    assert again["job_id"] == first["job_id"]
+    assert again["job"]["Status"] == "queued"
+    assert len(sends) == 1
+    message = json.loads(sends[0]["MessageBody"])
+    assert message["Job Id"] == first["job_id"]
+
+    # Resubmitted within SQS's deduplication window once the first run is done
+    check_queue.job_status.set_status(first["job_id"], "done")
+    assert submit(check_queue, End_Time="10")[1]["message"] == "Form received and processed."
+    assert len(sends) == 2
+    assert sends[0]["MessageDeduplicationId"] != sends[1]["MessageDeduplicationId"]
+    received = sqs.receive_message(QueueUrl=check_queue.QUEUE_URL, MaxNumberOfMessages=10)
+    assert len(received["Messages"]) == 2
@@ -0,0 +1,113 @@
+import importlib
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import dynamo_batch
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.delenv("DYNAMODB_TABLE", raising=False)
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="DeviceInformation",
+            KeySchema=[{"AttributeName": "DeviceName", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "DeviceName", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for i in range(150):
+            table.put_item(
+                Item={
+                    "DeviceName": f"acme_cam_{i}",
+                    "Python Map": {"graph_folder": f"graphs/{i}", "notes": "x" * 1000},
+                    "Firmware": "1.2.3",
+                }
+            )
+        import dynamodb_fn
+
+        yield importlib.reload(dynamodb_fn)
+
+
+def call(dynamodb_fn, **params):
+    response = dynamodb_fn.handler({"queryStringParameters": params}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def count_calls(monkeypatch, target, name):
+    calls = []
+    real = getattr(target, name)
+    monkeypatch.setattr(target, name, lambda **kw: calls.append(kw) or real(**kw))
+    return calls
+
+
+def test_single_lookup_reads_only_graph_folder_and_is_cached(table, monkeypatch):
+    gets = count_calls(monkeypatch, table.table, "get_item")
+
+    assert call(table, device_name="acme_cam_7") == (200, {"graph_folder": "graphs/7"})
+    assert call(table, device_name="acme_cam_7") == (200, {"graph_folder": "graphs/7"})
+
+    assert len(gets) == 1
+    assert gets[0]["ProjectionExpression"] == "#map.graph_folder"
+
+
+def test_missing_and_unknown_devices_return_json(table):
+    assert call(table) == (200, {"graph_folder": "None"})
+    status, body = call(table, device_name="acme_cam_999")
+    assert status == 404 and "acme_cam_999" in body["error"]
+
+
+def test_a_device_without_a_graph_folder_is_found_with_null(table):
+    table.table.put_item(Item={"DeviceName": "acme_cam_bare", "Firmware": "1.2.3"})
+
+    assert call(table, device_name="acme_cam_bare") == (200, {"graph_folder": None})
+    assert call(table, device_name="acme_cam_bare") == (200, {"graph_folder": None})
+    assert call(table, device_name="acme_cam_999")[0] == 404
+    assert call(table, device_name="acme_cam_999")[0] == 404
+
+
+def test_multi_device_lookup_batches_and_uses_the_cache(table, monkeypatch):
+    table.get_graph_folders(["acme_cam_0"])
+    batches = count_calls(monkeypatch, table.dynamodb, "batch_get_item")
+    names = [f"acme_cam_{i}" for i in range(120)] + ["acme_cam_999", "acme_cam_0"]
+
+    status, body = call(table, device_names=",".join(names))
+
+    assert status == 200
+    assert body["graph_folders"]["acme_cam_119"] == "graphs/119"
+    assert body["graph_folders"]["acme_cam_999"] is None
+    assert len(body["graph_folders"]) == 121
+    # acme_cam_0 came from the cache: 120 keys over two calls
+    assert [len(b["RequestItems"]["DeviceInformation"]["Keys"]) for b in batches] == [100, 20]
+
+
+def test_unprocessed_keys_are_retried(table, monkeypatch):
+    real = table.dynamodb.batch_get_item
+    calls = []
+
+    def flaky(RequestItems):
+        calls.append(RequestItems)
+        response = real(RequestItems=RequestItems)
+        if len(calls) == 1:
+            # DynamoDB hands back part of the request for the caller to retry
+            items = response["Responses"]["DeviceInformation"]
+            kept = [i for i in items if i["DeviceName"] != "acme_cam_2"]
+            response["Responses"]["DeviceInformation"] = kept
+            response["UnprocessedKeys"] = {
+                "DeviceInformation": {
+                    **RequestItems["DeviceInformation"],
+                    "Keys": [{"DeviceName": "acme_cam_2"}],
+                }
+            }
+        return response
+
+    monkeypatch.setattr(table.dynamodb, "batch_get_item", flaky)
+    monkeypatch.setattr(dynamo_batch.time, "sleep", lambda seconds: None)
+
+    result = table.get_graph_folders(["acme_cam_1", "acme_cam_2", "acme_cam_3"])
+
+    assert result == {f"acme_cam_{i}": f"graphs/{i}" for i in (1, 2, 3)}
+    assert calls[1]["DeviceInformation"]["Keys"] == [{"DeviceName": "acme_cam_2"}]
@@ -0,0 +1,159 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from moto import mock_aws
+
+import aws_clients
+import instrumentation
+
+
+@pytest.fixture
+def s3():
+    aws_clients.reset()
+    with mock_aws():
+        client = aws_clients.get_client("s3")
+        client.create_bucket(Bucket="bucket")
+        yield client
+    aws_clients.reset()
+
+
+def emf_records(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def emf(output):
+    return {line["Operation"]: line for line in emf_records(output)}
+
+
+def test_aws_calls_are_emitted_as_emf_per_operation(s3, capsys):
+    @instrumentation.instrumented
+    def handler(event, context):
+        etag = s3.put_object(Bucket="bucket", Key="a", Body=b"x" * 100)["ETag"]
+        for _ in range(2):
+            s3.list_objects_v2(Bucket="bucket")
+        try:
+            s3.head_object(Bucket="bucket", Key="missing")
+        except s3.exceptions.ClientError:
+            pass
+        try:
+            s3.get_object(Bucket="bucket", Key="a", IfNoneMatch=etag)
+        except s3.exceptions.ClientError:
+            pass
+        return {"statusCode": 200, "body": "ok"}
+
+    capsys.readouterr()
+    response = handler({}, None)
+    metrics = emf(capsys.readouterr().out)
+
+    assert set(metrics) == {
+        "handler", "s3.PutObject", "s3.ListObjectsV2", "s3.HeadObject", "s3.GetObject"
+    }
+    listing = metrics["s3.ListObjectsV2"]
+    assert (listing["Calls"], listing["Errors"]) == (2, 0)
+    # One latency value per call
+    assert len(listing["Latency"]) == 2
+    assert listing["BytesReceived"] > 0
+    assert metrics["s3.PutObject"]["BytesSent"] == 100
+    # An expected 404 is a client error, a 304 is neither
+    head = metrics["s3.HeadObject"]
+    assert (head["Errors"], head["ClientErrors"]) == (0, 1)
+    not_modified = metrics["s3.GetObject"]
+    assert (not_modified["Errors"], not_modified["ClientErrors"]) == (0, 0)
+    directive = listing["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["Function", "Operation"]]
+    assert {m["Name"] for m in directive["Metrics"]} <= set(listing)
+    assert listing["Function"] == __name__
+    assert "Server-Timing" not in response.get("headers", {})
+
+
+def test_each_invocation_reports_only_its_own_calls(s3, capsys):
+    @instrumentation.instrumented
+    def handler(event, context):
+        for _ in range(event["listings"]):
+            s3.list_objects_v2(Bucket="bucket")
+        return {"statusCode": 200}
+
+    handler({"listings": 3}, None)
+    capsys.readouterr()
+    handler({"listings": 1}, None)
+
+    assert emf(capsys.readouterr().out)["s3.ListObjectsV2"]["Calls"] == 1
+
+
+def test_a_failing_handler_is_recorded_as_an_error(capsys):
+    @instrumentation.instrumented
+    def handler(event, context):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        handler({}, None)
+
+    assert emf(capsys.readouterr().out)["handler"]["Errors"] == 1
+
+
+def test_latency_arrays_are_split_to_fit_emf():
+    totals = {"s3.GetObject": {"Calls": 250, "Errors": 0, "Latency": [1.0] * 250}}
+
+    records = instrumentation.emf_lines("fn", totals, 0)
+
+    assert [len(r["Latency"]) for r in records] == [100, 100, 50]
+    assert records[0]["Calls"] == 250
+    assert "Calls" not in records[1]
+    assert records[1]["_aws"]["CloudWatchMetrics"][0]["Metrics"] == instrumentation.LATENCY_METRIC
+
+
+def test_bound_worker_threads_report_to_their_own_invocation(s3, capsys):
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def late_refresh():
+        release.wait()
+        s3.list_objects_v2(Bucket="bucket")
+
+    @instrumentation.instrumented
+    def first(event, context):
+        executor.submit(instrumentation.bind(s3.head_bucket), Bucket="bucket").result()
+        # Like a WarmCache refresh, still running when the invocation returns
+        executor.submit(instrumentation.bind(late_refresh))
+        return {"statusCode": 200}
+
+    @instrumentation.instrumented
+    def second(event, context):
+        release.set()
+        executor.shutdown(wait=True)
+        return {"statusCode": 200}
+
+    first({}, None)
+    assert "s3.HeadBucket" in emf(capsys.readouterr().out)
+    second({}, None)
+
+    assert set(emf(capsys.readouterr().out)) == {"handler"}
+
+
+def test_server_timing_header(s3, monkeypatch):
+    monkeypatch.setattr(instrumentation, "SERVER_TIMING", True)
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        s3.list_objects_v2(Bucket="bucket")
+        with instrumentation.timed("postgres.execute"):
+            pass
+        return {"statusCode": 200, "headers": {"X-Cache": "Hit"}}
+
+    headers = handler({}, None)["headers"]
+
+    assert headers["X-Cache"] == "Hit"
+    timings = headers["Server-Timing"].split(", ")
+    assert [t.split(";")[0] for t in timings] == ["handler", "postgres.execute", "s3.ListObjectsV2"]
+    assert timings[2].endswith('desc="1 calls"')
+
+
+def test_off_leaves_handlers_and_clients_alone(monkeypatch):
+    monkeypatch.setattr(instrumentation, "INSTRUMENTATION", "off")
+
+    def handler(event, context):
+        return {}
+
+    assert instrumentation.instrumented(handler) is handler
@@ -0,0 +1,117 @@
+import csv
+import gzip
+import io
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import inventory_volumes
+
+INVENTORY = "inventory-bucket"
+DELIVERY = "inv/client1-pilot/daily/2025-03-05T01-00Z/"
+ROOT = "client1-raw-data/client1_dev_01"
+
+
+def csv_gz(rows):
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return gzip.compress(text.getvalue().encode())
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        monkeypatch.setattr(inventory_volumes, "s3", client)
+        monkeypatch.setattr(inventory_volumes, "INVENTORY_BUCKET", INVENTORY)
+        monkeypatch.setattr(inventory_volumes, "INVENTORY_PREFIXES", "inv/client1-pilot/daily/")
+        client.create_bucket(Bucket=INVENTORY)
+        client.create_bucket(Bucket="client1-pilot")
+        yield client
+
+
+def put_inventory(s3, files):
+    keys = []
+    for i, rows in enumerate(files):
+        key = f"inv/client1-pilot/daily/data/{i}.csv.gz"
+        s3.put_object(Bucket=INVENTORY, Key=key, Body=csv_gz(rows))
+        keys.append({"key": key})
+    manifest = {
+        "fileFormat": "CSV",
+        "fileSchema": "Bucket, Key, Size, LastModifiedDate",
+        "files": keys,
+    }
+    s3.put_object(Bucket=INVENTORY, Key=f"{DELIVERY}manifest.json", Body=json.dumps(manifest))
+
+
+def test_aggregates_frame_bytes_per_device_day(s3):
+    put_inventory(
+        s3,
+        [
+            [
+                ["client1-pilot", f"{ROOT}/2025-03-01/all_frames/all_frames/a.jpg", "10", ""],
+                ["client1-pilot", f"{ROOT}/2025-03-01/all_frames/all_frames/b.jpg", "15", ""],
+                ["client1-pilot", f"{ROOT}/2025-03-01/other/c.jpg", "99", ""],
+            ],
+            [
+                ["client1-pilot", f"{ROOT}/2025-03-04/all_frames/all_frames/d%20e.jpg", "7", ""],
+                ["client1-pilot", f"{ROOT}/2025-03-05/all_frames/all_frames/f.jpg", "8", ""],
+                ["client1-pilot", f"{ROOT}/2024-12-31/all_frames/all_frames/g.jpg", "9", ""],
+            ],
+        ],
+    )
+
+    assert inventory_volumes.handler({}, None) == {"indexes": 1}
+
+    body = s3.get_object(Bucket="client1-pilot", Key="date-index/client1_dev_01.json")
+    index = json.loads(body["Body"].read())
+    assert index["last_indexed"] == "2025-03-04"
+    assert index["days"] == {"2025-03-01": 25, "2025-03-04": 7}
+
+
+def test_keeps_days_indexed_after_the_snapshot(s3):
+    s3.put_object(
+        Bucket="client1-pilot",
+        Key="date-index/client1_dev_01.json",
+        Body=json.dumps(
+            {
+                "threshold": inventory_volumes.SIZE_THRESHOLD,
+                "last_indexed": "2025-03-06",
+                "days": {"2025-03-06": 5},
+            }
+        ),
+    )
+    put_inventory(
+        s3, [[["client1-pilot", f"{ROOT}/2025-03-02/all_frames/all_frames/a.jpg", "3", ""]]]
+    )
+
+    inventory_volumes.handler({"manifest_key": f"{DELIVERY}manifest.json"}, None)
+
+    body = s3.get_object(Bucket="client1-pilot", Key="date-index/client1_dev_01.json")
+    index = json.loads(body["Body"].read())
+    assert index["last_indexed"] == "2025-03-06"
+    assert index["days"] == {"2025-03-02": 3, "2025-03-06": 5}
+
+
+def test_parse_frame_key_ignores_other_keys():
+    assert inventory_volumes.parse_frame_key(f"{ROOT}/2025-03-01/x.jpg") is None
+    assert inventory_volumes.parse_frame_key(
+        f"{ROOT}/2025-03-01/all_frames/all_frames/x.jpg"
+    ) == ("client1", "client1_dev_01", "2025-03-01")
+
+
+def test_write_index_only_treats_missing_keys_as_new(s3, monkeypatch):
+    def denied(**kwargs):
+        raise s3.exceptions.ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "GetObject"
+        )
+
+    index = {"threshold": 1, "last_indexed": "2025-03-04", "days": {}}
+    inventory_volumes.write_index("client1", "new_dev", dict(index))
+    assert s3.get_object(Bucket="client1-pilot", Key="date-index/new_dev.json")
+
+    monkeypatch.setattr(s3, "get_object", denied)
+    with pytest.raises(s3.exceptions.ClientError):
+        inventory_volumes.write_index("client1", "new_dev", dict(index))
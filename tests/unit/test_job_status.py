@@ -0,0 +1,90 @@
+import importlib
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+
+@pytest.fixture
+def job_status(monkeypatch):
+    monkeypatch.setenv("JOB_STATUS_TABLE", "JobStatus")
+    with mock_aws():
+        boto3.resource("dynamodb", region_name="us-east-1").create_table(
+            TableName="JobStatus",
+            KeySchema=[{"AttributeName": "JobId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "JobId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        import job_status
+
+        yield importlib.reload(job_status)
+    monkeypatch.delenv("JOB_STATUS_TABLE")
+    importlib.reload(job_status)
+
+
+def call(job_status, body=None, **params):
+    response = job_status.handler({"queryStringParameters": params, "body": body}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_a_job_is_claimed_once_until_it_finishes(job_status):
+    job = {"Device": "acme_cam_1"}
+
+    assert job_status.claim("abc", job, now=1000) is None
+    assert job_status.claim("abc", job, now=1010)["Status"] == "queued"
+
+    job_status.set_status("abc", "running", now=1020)
+    assert job_status.claim("abc", job, now=1030)["Status"] == "running"
+
+    job_status.set_status("abc", "failed", error="boom", now=1040)
+    assert job_status.claim("abc", job, now=1050) is None
+
+
+def test_a_stale_claim_can_be_replaced(job_status):
+    job_status.claim("abc", {"Device": "acme_cam_1"}, now=1000)
+
+    later = 1000 + job_status.RESUBMIT_AFTER + 1
+    assert job_status.claim("abc", {"Device": "acme_cam_1"}, now=later) is None
+
+
+def test_unknown_status_is_refused(job_status):
+    with pytest.raises(ValueError):
+        job_status.set_status("abc", "lost")
+
+
+def test_single_and_batch_reads(job_status):
+    job_status.claim("a", {"Device": "acme_cam_1"}, now=1000)
+    job_status.claim("b", {"Device": "acme_cam_2"}, now=1000)
+    job_status.set_status("b", "done", now=1100)
+
+    status, body = call(job_status, job_id="a")
+    assert status == 200
+    assert (body["Status"], body["Device"]) == ("queued", "acme_cam_1")
+    assert "ExpiresAt" not in body
+
+    status, body = call(job_status, job_ids="a,b,zzz")
+    assert {k: v and v["Status"] for k, v in body["jobs"].items()} == {
+        "a": "queued",
+        "b": "done",
+        "zzz": None,
+    }
+    assert call(job_status, body=json.dumps({"job_ids": ["b"]}))[1]["jobs"]["b"][
+        "UpdatedAt"
+    ].startswith("1970-01-01T00:18:20")
+
+    assert call(job_status, job_id="zzz")[0] == 404
+    assert call(job_status)[0] == 400
+
+
+def test_an_empty_error_message_is_stored(job_status):
+    job_status.claim("abc", {"Device": "acme_cam_1"}, now=1000)
+
+    job_status.set_status("abc", "failed", error="", now=1010)
+
+    assert job_status.get_job("abc")["Error"] == ""
+
+
+def test_malformed_bodies_are_a_400(job_status):
+    for body in ('["a", "b"]', '{"job_ids": "a"}', '{"job_ids": [1]}', "not json"):
+        assert call(job_status, body=body)[0] == 400
@@ -0,0 +1,194 @@
+import importlib
+import json
+
+import boto3
+import psycopg2
+import psycopg2.errors
+import pytest
+from moto import mock_aws
+
+ROWS = [
+    ("Client A", "Cam 1", "a_dev_1", 1),
+    ("Client A", None, "a_dev_2", 1),
+    ("Client B", "Cam 1", None, 2),
+]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if self.conn.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        if self.conn.server.drop_next:
+            self.conn.server.drop_next = False
+            self.conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.server.queries.append(sql)
+        if "count(*)" in sql and self.conn.server.probe_error:
+            raise self.conn.server.probe_error
+
+    def fetchall(self):
+        if "count(*)" in self.conn.server.queries[-1]:
+            return [(len(ROWS) + self.conn.server.version, None)]
+        if "jsonb_object_agg" in self.conn.server.queries[-1]:
+            return [('{"Client A": {"Cam 1": {"device_name": "a_dev_1"}}}',)]
+        return list(ROWS)
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = 0
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePostgres:
+    """Stands in for psycopg2.connect and counts handshakes."""
+
+    def __init__(self):
+        self.connects = 0
+        self.queries = []
+        self.drop_next = False
+        self.version = 0
+        self.probe_error = None
+
+    def connect(self, **kwargs):
+        self.connects += 1
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def query_rds(monkeypatch):
+    with mock_aws():
+        ssm = boto3.client("ssm", region_name="ca-central-1")
+        ssm.put_parameter(
+            Name="/rds/credentials",
+            Type="SecureString",
+            Value=json.dumps({"host": "db", "user": "u", "password": "p"}),
+        )
+        import query_rds
+
+        module = importlib.reload(query_rds)
+        server = FakePostgres()
+        monkeypatch.setattr(module.psycopg2, "connect", server.connect)
+        module.server = server
+        monkeypatch.setattr(module.directory_cache, "ttl", 0)
+        yield module
+        module.close_connection()
+
+
+def test_connection_is_reused_across_invocations(query_rds):
+    for _ in range(50):
+        response = query_rds.handler({}, None)
+
+    assert query_rds.server.connects == 1
+    assert json.loads(response["body"]) == {
+        "Client A": {
+            "Cam 1": {"device_name": "a_dev_1", "client_number": 1},
+            "a_dev_2": {"device_name": "a_dev_2", "client_number": 1},
+        }
+    }
+
+
+def test_reconnects_after_the_server_drops_the_connection(query_rds):
+    query_rds.handler({}, None)
+    query_rds.server.drop_next = True
+
+    response = query_rds.handler({}, None)
+
+    assert response["statusCode"] == 200
+    assert query_rds.server.connects == 2
+
+
+def test_postgres_calls_are_reported_with_the_invocation(query_rds, capsys):
+    query_rds.handler({}, None)
+    capsys.readouterr()
+
+    query_rds.handler({}, None)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    calls = {line["Operation"]: line["Calls"] for line in lines}
+    # Warm: no handshake, only the version probe
+    assert "postgres.connect" not in calls
+    assert calls["postgres.execute"] == 1
+    assert calls["handler"] == 1
+
+
+def test_postgres_engine_passes_json_through(query_rds, monkeypatch):
+    monkeypatch.setattr(query_rds, "DIRECTORY_ENGINE", "postgres")
+
+    response = query_rds.handler({}, None)
+
+    assert "jsonb_object_agg" in query_rds.server.queries[-1]
+    assert response["body"] == '{"Client A": {"Cam 1": {"device_name": "a_dev_1"}}}'
+
+
+def test_directory_is_cached_until_the_version_changes(query_rds):
+    def directory_queries():
+        return sum("device_alias" in q for q in query_rds.server.queries)
+
+    first = query_rds.handler({}, None)
+    second = query_rds.handler({}, None)
+    assert (first["headers"]["X-Cache"], second["headers"]["X-Cache"]) == ("Miss", "Hit")
+    assert second["body"] == first["body"]
+    assert directory_queries() == 1
+
+    query_rds.server.version += 1
+    third = query_rds.handler({}, None)
+
+    assert third["headers"]["X-Cache"] == "Miss"
+    assert directory_queries() == 2
+
+
+def test_credentials_are_loaded_lazily_and_reloaded_after_auth_failure(query_rds, monkeypatch):
+    assert query_rds.credentials is None
+
+    loads = []
+    real_get = query_rds.get_ssm_parameter
+    monkeypatch.setattr(
+        query_rds, "get_ssm_parameter", lambda **kw: loads.append(kw) or real_get(**kw)
+    )
+    real_connect = query_rds.server.connect
+
+    def reject_first(**kwargs):
+        if not loads[1:]:
+            raise psycopg2.OperationalError("password authentication failed")
+        return real_connect(**kwargs)
+
+    monkeypatch.setattr(query_rds.psycopg2, "connect", reject_first)
+
+    assert query_rds.handler({}, None)["statusCode"] == 200
+    assert len(loads) == 2
+
+
+def test_version_probe_survives_transient_errors(query_rds):
+    query_rds.handler({}, None)
+    query_rds.server.probe_error = psycopg2.OperationalError("could not receive data")
+
+    assert query_rds.handler({}, None)["headers"]["X-Cache"] == "Miss"
+    assert query_rds.DIRECTORY_VERSION_SQL
+
+    query_rds.server.probe_error = None
+    query_rds.handler({}, None)
+    assert query_rds.handler({}, None)["headers"]["X-Cache"] == "Hit"
+
+
+def test_version_probe_is_disabled_when_its_column_is_missing(query_rds):
+    query_rds.server.probe_error = psycopg2.errors.UndefinedColumn("no updated_at")
+
+    assert query_rds.handler({}, None)["statusCode"] == 200
+    assert query_rds.DIRECTORY_VERSION_SQL is None
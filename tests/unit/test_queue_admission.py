@@ -0,0 +1,50 @@
+from queue_admission import DrainModel, admit
+
+
+def model_from(snapshots, sent=None):
+    """Replay (seconds, depth) snapshots, with sent[i] jobs before snapshot i."""
+    model = DrainModel(window=600)
+    for i, (now, depth) in enumerate(snapshots):
+        if sent and sent[i]:
+            model.sent(sent[i])
+        model.record(now, depth)
+    return model
+
+
+def test_rate_counts_drained_messages_over_the_window():
+    model = model_from([(0, 30), (60, 24), (120, 18)])
+
+    assert model.rate() == 0.1
+    assert model.wait_seconds(18) == 180
+
+
+def test_own_sends_are_added_back_when_estimating_drain():
+    # Depth stayed flat while this container sent 6 jobs: 6 were drained.
+    model = model_from([(0, 10), (60, 10)], sent=[0, 6])
+
+    assert model.rate() == 0.1
+
+
+def test_rate_is_unknown_without_history_or_progress():
+    assert model_from([(0, 5)]).rate() is None
+    assert model_from([(0, 5), (60, 5)]).rate() is None
+
+
+def test_old_snapshots_fall_out_of_the_window():
+    model = model_from([(0, 100), (60, 40), (700, 40), (760, 34)])
+
+    assert model.rate() == 0.1
+
+
+def test_admit_accepts_under_the_limit_with_an_eta():
+    model = model_from([(0, 30), (60, 24)])
+
+    assert admit(24, 50, model) == (1, 240, None)
+
+
+def test_admit_rejects_over_the_limit_with_a_retry_hint():
+    model = model_from([(0, 30), (60, 24)])
+
+    assert admit(50, 50, model) == (0, 500, 10)
+    assert admit(48, 50, model, requested=5) == (2, 480, 30)
+    assert admit(50, 50, DrainModel(), default_retry=30) == (0, None, 30)
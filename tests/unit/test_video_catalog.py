@@ -0,0 +1,194 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import s3_full_test
+import s3_match
+import video_catalog
+
+BUCKET = "videos-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    monkeypatch.setenv("CLOUDFRONT_DOMAIN", "cdn.example.com")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        monkeypatch.setattr(video_catalog, "s3", client)
+        monkeypatch.setattr(video_catalog, "indexed_catalogs", video_catalog.WarmCache(ttl=0))
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def put(s3, *keys):
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b"x" * len(key))
+
+
+def s3_event(name, *keys):
+    return {
+        "Records": [
+            {
+                "eventName": name,
+                "s3": {"bucket": {"name": BUCKET}, "object": {"key": key.replace(" ", "+")}},
+            }
+            for key in keys
+        ]
+    }
+
+
+def listed(handler_module, monkeypatch):
+    monkeypatch.setattr(handler_module, "VIDEO_CATALOG", "off")
+    body = handler_module.handler({}, None)["body"]
+    monkeypatch.setattr(handler_module, "VIDEO_CATALOG", "s3")
+    return json.loads(body)
+
+
+def test_parse_rules_match_the_handlers():
+    assert video_catalog.parse_video_key("acme_site_cam_2025-03-01_1.mp4") == (
+        "acme",
+        "site_cam",
+        "2025-03-01",
+    )
+    assert video_catalog.parse_video_key(
+        "acme_site_cam_2025-03-01_1_unannotated.mp4"
+    ) == ("acme", "site_cam", "2025-03-01")
+    assert video_catalog.parse_test_key("acme_cam_2025-03-01_1.mp4") == (
+        "acme",
+        "acme_cam",
+        "2025-03-01",
+    )
+
+
+def test_events_keep_the_catalog_equal_to_a_listing(s3, monkeypatch):
+    put(s3, "video/acme_cam_2025-03-01_1.mp4", "vis_test/acme_cam_2025-03-01_1.mp4")
+    assert json.loads(s3_match.handler({}, None)["body"]) == listed(s3_match, monkeypatch)
+    assert json.loads(s3_full_test.handler({}, None)["body"]) == listed(
+        s3_full_test, monkeypatch
+    )
+
+    created = [
+        "video/acme_cam_2025-03-02_1_unannotated.mp4",
+        "vis_test/acme_cam_2025-03-02_1.mp4",
+        "pdf_evidance/acme_cam_2025-03-02_1.pdf",
+        "video/notes.txt",
+    ]
+    put(s3, *created)
+    video_catalog.handler(s3_event("ObjectCreated:Put", *created), None)
+    s3.delete_object(Bucket=BUCKET, Key="video/acme_cam_2025-03-01_1.mp4")
+    video_catalog.handler(
+        s3_event("ObjectRemoved:Delete", "video/acme_cam_2025-03-01_1.mp4"), None
+    )
+
+    videos = json.loads(s3_match.handler({}, None)["body"])
+    tests = json.loads(s3_full_test.handler({}, None)["body"])
+    assert [v["name"] for v in videos] == ["acme_cam_2025-03-02_1_unannotated.mp4"]
+    assert tests[1]["pdf_url"] == "https://cdn.example.com/pdf_evidance/acme_cam_2025-03-02_1.pdf"
+    assert videos == listed(s3_match, monkeypatch)
+    assert tests == listed(s3_full_test, monkeypatch)
+
+
+def test_get_handlers_never_write_the_catalog(s3, monkeypatch):
+    put(s3, "video/acme_cam_2025-03-01_1.mp4")
+    key = video_catalog.catalog_key("video/")
+
+    # Missing: served from a listing, left for the event handler to create
+    assert len(json.loads(s3_match.handler({}, None)["body"])) == 1
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET, Prefix=key)
+
+    # Expired: the same, and the stale object is left alone
+    video_catalog.handler(s3_event("ObjectCreated:Put", "video/acme_cam_2025-03-01_1.mp4"), None)
+    etag = s3.head_object(Bucket=BUCKET, Key=key)["ETag"]
+    put(s3, "video/acme_cam_2025-03-02_1.mp4")
+    monkeypatch.setattr(video_catalog, "CATALOG_MAX_AGE", -1)
+    listings = []
+    real_build = video_catalog.build_catalog
+    monkeypatch.setattr(
+        video_catalog, "build_catalog", lambda *a: listings.append(a) or real_build(*a)
+    )
+
+    assert len(json.loads(s3_match.handler({}, None)["body"])) == 2
+    assert s3.head_object(Bucket=BUCKET, Key=key)["ETag"] == etag
+    assert len(listings) == 1
+
+
+def test_pages_filter_by_client_device_and_date(s3, monkeypatch):
+    put(
+        s3,
+        *[f"video/acme_cam1_2025-03-{day:02d}_{day}.mp4" for day in range(1, 8)],
+        "video/acme_cam2_2025-03-03_1.mp4",
+        "video/zeta_cam1_2025-03-03_1.mp4",
+    )
+
+    def get(**params):
+        return json.loads(s3_match.handler({"queryStringParameters": params}, None)["body"])
+
+    page = get(client="acme", deviceName="cam1", start_date="2025-03-02", page_size="2")
+    assert [v["date"] for v in page["videos"]] == ["2025-03-02", "2025-03-03"]
+    page = get(client="acme", deviceName="cam1", start_date="2025-03-02", page_size="2",
+               cursor=page["next_cursor"])
+    assert [v["date"] for v in page["videos"]] == ["2025-03-04", "2025-03-05"]
+
+    page = get(client="acme", end_date="2025-03-03")
+    assert [(v["deviceName"], v["date"]) for v in page["videos"]] == [
+        ("cam1", "2025-03-01"),
+        ("cam1", "2025-03-02"),
+        ("cam1", "2025-03-03"),
+        ("cam2", "2025-03-03"),
+    ]
+    assert page["next_cursor"] is None
+    assert [v["client"] for v in get(deviceName="cam1", page_size="100")["videos"]].count("zeta") == 1
+
+
+def test_unchanged_catalog_is_not_downloaded_again(s3, monkeypatch):
+    put(s3, "video/acme_cam_2025-03-01_1.mp4")
+    video_catalog.handler(s3_event("ObjectCreated:Put", "video/acme_cam_2025-03-01_1.mp4"), None)
+    s3_match.handler({}, None)
+    calls = []
+    real_get = s3.get_object
+
+    def get_object(**kwargs):
+        calls.append(kwargs)
+        return real_get(**kwargs)
+
+    monkeypatch.setattr(s3, "get_object", get_object)
+    s3_match.handler({}, None)
+
+    assert calls and calls[0]["IfNoneMatch"]
+
+
+def test_page_size_is_clamped_and_bad_paging_input_is_a_400(s3, monkeypatch):
+    put(s3, *[f"video/acme_cam1_2025-03-0{day}_{day}.mp4" for day in range(1, 4)])
+    monkeypatch.setattr(video_catalog, "MAX_PAGE_SIZE", 2)
+
+    def get(**params):
+        return s3_match.handler({"queryStringParameters": params}, None)
+
+    for page_size, expected in (("-1", 1), ("0", 1), ("50", 2)):
+        page = json.loads(get(page_size=page_size)["body"])
+        assert len(page["videos"]) == expected
+        assert page["next_cursor"]
+
+    not_a_list = video_catalog.base64.urlsafe_b64encode(b'{"a": 1}').decode()
+    for params in ({"page_size": "ten"}, {"cursor": "%%%"}, {"cursor": "bm90IGpzb24="},
+                   {"cursor": not_a_list}):
+        response = get(**params)
+        assert response["statusCode"] == 400
+        assert "error" in json.loads(response["body"])
+
+
+def test_ndjson_pages_put_the_cursor_in_a_header(s3):
+    put(s3, *[f"video/acme_cam1_2025-03-0{day}_{day}.mp4" for day in range(1, 4)])
+
+    response = s3_match.handler(
+        {"queryStringParameters": {"client": "acme", "page_size": "2", "format": "ndjson"}},
+        None,
+    )
+
+    lines = response["body"].splitlines()
+    assert [json.loads(line)["date"] for line in lines] == ["2025-03-01", "2025-03-02"]
+    assert response["headers"]["Content-Type"] == "application/x-ndjson"
+    assert response["headers"]["X-Next-Cursor"]
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from warm_cache import MISSING, WarmCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = WarmCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b", MISSING) is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+    assert cache.stats["evictions"] == 1
+
+
+def test_entries_expire_and_are_revalidated_or_reloaded():
+    clock = Clock()
+    cache = WarmCache(ttl=10, clock=clock)
+    loads, version = [], {"v": 1}
+
+    def load():
+        loads.append(1)
+        return {"version": version["v"]}
+
+    def revalidate(old):
+        return old if old["version"] == version["v"] else load()
+
+    first, outcome = cache.fetch("k", load, revalidate)
+    assert outcome == "miss"
+    assert cache.fetch("k", load, revalidate) == (first, "hit")
+
+    clock.now = 11
+    assert cache.fetch("k", load, revalidate) == (first, "revalidated")
+    assert len(loads) == 1
+
+    clock.now = 22
+    version["v"] = 2
+    assert cache.fetch("k", load, revalidate) == ({"version": 2}, "miss")
+    assert cache.stats == {
+        "hits": 1,
+        "misses": 2,
+        "stale_hits": 0,
+        "revalidated": 1,
+        "refreshes": 0,
+        "evictions": 0,
+        "load_errors": 0,
+    }
+
+
+def test_stale_value_is_served_while_it_refreshes_in_the_background():
+    clock = Clock()
+    cache = WarmCache(ttl=10, stale_ttl=30, clock=clock)
+    cache.put("k", "old")
+    release = threading.Event()
+
+    def slow_load():
+        release.wait(5)
+        return "new"
+
+    clock.now = 15
+    assert cache.fetch("k", slow_load) == ("old", "stale")
+    assert cache.fetch("k", slow_load) == ("old", "stale")
+    release.set()
+    for _ in range(100):
+        if cache.get("k") == "new":
+            break
+        time.sleep(0.01)
+
+    assert cache.get("k") == "new"
+    assert cache.stats["refreshes"] == 1
+
+    # Past the stale window the caller waits for a fresh value
+    clock.now = 100
+    assert cache.fetch("k", lambda: "newer") == ("newer", "miss")
+
+
+def test_concurrent_misses_share_one_load():
+    cache = WarmCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    threads = [threading.Thread(target=cache.get_or_load, args=("k", load)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.get("k") == "value"
+
+
+def test_failed_load_is_counted_and_not_cached():
+    cache = WarmCache()
+
+    def fail():
+        raise RuntimeError("down")
+
+    try:
+        cache.get_or_load("k", fail)
+    except RuntimeError:
+        pass
+
+    assert cache.stats["load_errors"] == 1
+    assert cache.get_or_load("k", lambda: 1) == 1
@@ -0,0 +1,88 @@
+import worker_scaler
+from worker_scaler import QueueSample, ScalingPolicy
+
+
+def run(policy, backlog_series, active=0, step=60):
+    """Feed one backlog value per tick and return the worker count after each."""
+    state = {}
+    history = []
+    for tick, backlog in enumerate(backlog_series):
+        active = policy.decide(state, [QueueSample(backlog, 0)], active, tick * step)
+        history.append(active)
+    return history
+
+
+def test_scales_out_to_backlog_per_worker_and_caps_at_max():
+    policy = ScalingPolicy(backlog_per_worker=5, max_workers=3, scale_out_cooldown=0)
+
+    assert run(policy, [0, 1, 6, 11, 40]) == [0, 1, 2, 3, 3]
+
+
+def test_scale_out_cooldown_holds_further_growth():
+    policy = ScalingPolicy(backlog_per_worker=5, max_workers=4, scale_out_cooldown=120)
+
+    assert run(policy, [6, 20, 20, 20]) == [2, 2, 4, 4]
+
+
+def test_scales_in_one_worker_after_sustained_low_backlog():
+    policy = ScalingPolicy(
+        backlog_per_worker=10,
+        max_workers=3,
+        scale_out_cooldown=0,
+        scale_in_cooldown=120,
+        idle_timeout=180,
+    )
+
+    history = run(policy, [30] + [5] * 4 + [0] * 8)
+
+    # Every step down needs idle_timeout of low backlog since the last one
+    assert history == [3, 3, 3, 3, 2, 2, 2, 1, 1, 1, 0, 0, 0]
+
+
+def test_hysteresis_band_keeps_a_steady_backlog_from_flapping():
+    policy = ScalingPolicy(
+        backlog_per_worker=10, max_workers=2, scale_out_cooldown=0, idle_timeout=0,
+        scale_in_cooldown=0,
+    )
+
+    # 12 messages need two workers; one worker could only take them if the
+    # backlog fell to half its share, so the pool stays at two.
+    assert run(policy, [12, 8, 12, 7, 12]) == [2, 2, 2, 2, 2]
+
+
+def test_never_stops_the_last_worker_while_messages_are_in_flight():
+    policy = ScalingPolicy(max_workers=1, idle_timeout=0, scale_in_cooldown=0)
+    state = {}
+
+    assert policy.decide(state, [QueueSample(0, 1)], 1, 0) == 1
+    assert policy.decide(state, [QueueSample(0, 0)], 1, 60) == 0
+
+
+def test_does_not_stop_workers_while_messages_are_in_flight():
+    policy = ScalingPolicy(
+        backlog_per_worker=10, max_workers=2, idle_timeout=0, scale_in_cooldown=0
+    )
+    state = {}
+
+    assert policy.decide(state, [QueueSample(0, 2)], 2, 0) == 2
+    assert policy.decide(state, [QueueSample(0, 0)], 2, 60) == 1
+
+
+def test_an_unconfigured_pool_touches_no_instances(monkeypatch):
+    monkeypatch.delenv("WORKER_INSTANCE_IDS", raising=False)
+    monkeypatch.delenv("INSTANCE_ID", raising=False)
+    # Any SQS, EC2 or SSM call would fail on None
+    for client in ("sqs", "ec2", "ssm"):
+        monkeypatch.setattr(worker_scaler, client, None)
+
+    result = worker_scaler.handler({}, None)
+
+    assert (result["target"], result["started"], result["stopped"]) == (0, [], [])
+
+
+def test_only_the_worker_queue_is_scaled_on_by_default():
+    environ = {"QUEUE_URL": "fifo-url", "QUEUE_URL_2": "analysis-url"}
+    assert worker_scaler.scaler_queue_urls(environ) == ["fifo-url"]
+
+    environ["SCALER_QUEUE_URLS"] = "fifo-url, other-url"
+    assert worker_scaler.scaler_queue_urls(environ) == ["fifo-url", "other-url"]